@@ -1,6 +1,4 @@
 import requests
-import pandas as pd
-import numpy as np
 import time
 
 def get_price(code, count=100, frequency='1d'):
@@ -8,6 +6,9 @@ def get_price(code, count=100, frequency='1d'):
     获取股票价格数据
     frequency: 1d, 1w, 1M, 5m, 15m, 30m, 60m
     """
+    # pandas / numpy 在第一次取数时再导入，避免拖慢应用启动
+    import numpy as np
+    import pandas as pd
     # 原有获取价格数据的逻辑保持不变
     # ...（此处省略原有代码）
     
@@ -40,6 +41,13 @@ def get_stock_basic():
     ]
     return stocks
 
+# calculate_indicators 输出并保存到 stock_indicators 的指标列
+INDICATOR_COLUMNS = ['ma5', 'ma10', 'ma20', 'ma60', 'macd', 'macd_diff', 'macd_dea',
+                     'rsi', 'kdj_k', 'kdj_d', 'kdj_j']
+
+# 指标计算所需的最长回看窗口（MA60）
+INDICATOR_WARMUP = 60
+
 def calculate_indicators(df):
     """
     计算常用技术指标并添加到DataFrame中
@@ -1,17 +1,36 @@
-from flask import Flask, render_template, request, jsonify
-import pandas as pd
-from datetime import datetime
-from Ashare import get_price, get_stock_basic, calculate_indicators
+from flask import Flask, Response, render_template, request, jsonify
+import sys
+from datetime import datetime, timedelta
+from Ashare import get_stock_basic, INDICATOR_COLUMNS, INDICATOR_WARMUP
 from db_operations import StockDatabase
+from serialization import (BINARY_MIMETYPE, HISTORY_COLUMNS, KLINE_COLUMNS, downsample_bars, frame_binary,
+                           frame_columns, frame_records)
+from http_cache import conditional_page, init_compression
+from metrics import init_metrics
+from profiling import init_profiling
+from quotes import QuotePoller
+from upstream import fetch_price
+from search import StockSearch
 import config
 
 # 初始化Flask应用
 app = Flask(__name__)
 app.config.from_object(config)
+# 先注册指标钩子，after_request 逆序执行，请求耗时包含压缩时间
+init_metrics(app)
+init_compression(app)
+# 按需对单个请求做 cProfile / tracemalloc 分析（见 config.PROFILE_MODE / PROFILE_HEADER）
+init_profiling(app)
 
 # 初始化数据库连接
 db = StockDatabase()
 
+# 股票搜索索引（随股票列表缓存重建）
+stock_search = StockSearch(db.stock_cache)
+
+# 实时行情轮询器（按股票代码共享上游请求）
+quote_poller = QuotePoller()
+
 # 首页路由
 @app.route('/')
 def index():
@@ -27,15 +46,27 @@ def index():
 def all_stocks():
     """全部股票列表页面，支持分页和搜索"""
     page = int(request.args.get('page', 1))
-    stocks_data = db.get_all_stocks(page=page, page_size=30)
+    # 点击“下一页”时带上当前页最后一只股票的代码，直接按游标分页
+    after_code = request.args.get('after')
     
-    # 获取每个股票是否在自选列表中
-    for stock in stocks_data['stocks']:
-        stock['is_favorite'] = db.is_favorite(stock['code'])
+    def render():
+        stocks_data = db.get_all_stocks(page=page, page_size=30, after_code=after_code)
+        
+        # 获取每个股票是否在自选列表中（一次查询）
+        favorite_codes = db.get_favorite_codes([stock['code'] for stock in stocks_data['stocks']])
+        for stock in stocks_data['stocks']:
+            stock['is_favorite'] = stock['code'] in favorite_codes
+        
+        html = render_template('all_stocks.html', 
+                              stocks_data=stocks_data,
+                              current_page=page)
+        # 数据库出错时的空列表不能带缓存校验值，否则恢复后浏览器仍会得到 304
+        return (html, 503) if stocks_data.get('error') else html
     
-    return render_template('all_stocks.html', 
-                          stocks_data=stocks_data,
-                          current_page=page)
+    # 股票列表和自选列表都未变化时返回 304
+    stock_list_updated = db.get_stock_list_updated()
+    return conditional_page((stock_list_updated, db.get_favorites_version()),
+                            stock_list_updated, render)
 
 # 自选股票页面
 @app.route('/favorites')
@@ -43,24 +74,30 @@ def favorites():
     """自选股票页面，显示用户添加的自选股票"""
     favorite_stocks = db.get_favorite_stocks()
     
-    # 获取自选股票的最新价格和涨跌幅
+    # 获取自选股票的最新价格和涨跌幅（一次查询，向量化计算）
+    codes = [stock['code'] for stock in favorite_stocks]
+    latest_bars = db.get_latest_bars(codes, '1d')
+    # 数据管道 stock_data 中有更新的日线时以其为准
+    for code, bar in db.get_pipeline_latest_bars(codes).items():
+        if code not in latest_bars or bar[0] >= latest_bars[code][0]:
+            latest_bars[code] = bar
+    quoted = [stock for stock in favorite_stocks if stock['code'] in latest_bars]
     for stock in favorite_stocks:
-        try:
-            # 获取最新价格
-            df = db.get_stock_history(stock['code'], '1d', limit=1)
-            if df is not None and not df.empty:
-                stock['latest_price'] = round(float(df.iloc[-1]['close']), 2)
-                stock['change'] = round(
-                    (stock['latest_price'] - float(df.iloc[-1]['open'])) / float(df.iloc[-1]['open']) * 100, 
-                    2
-                )
-            else:
-                stock['latest_price'] = 'N/A'
-                stock['change'] = 0
-        except Exception as e:
-            print(f"获取 {stock['code']} 最新价格出错: {e}")
-            stock['latest_price'] = 'N/A'
-            stock['change'] = 0
+        stock['latest_price'] = 'N/A'
+        stock['change'] = 0
+    if quoted:
+        import numpy as np
+        # 最新K线元组: (time, open, high, low, close, volume, amount)
+        bars = np.array([latest_bars[stock['code']][1:5] for stock in quoted], dtype=float)
+        opens = bars[:, 0]
+        prices = np.round(bars[:, 3], 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes = np.round((prices - opens) / opens * 100, 2)
+        changes[~np.isfinite(changes)] = 0
+        for stock, price, change in zip(quoted, prices.tolist(), changes.tolist()):
+            if not np.isnan(price):
+                stock['latest_price'] = price
+                stock['change'] = change
     
     return render_template('favorites.html', 
                           stocks=favorite_stocks)
@@ -71,41 +108,23 @@ def realtime():
     """股票实时数据页面"""
     stock_code = request.args.get('code', 'sh000001')
     
-    # 获取股票信息
-    stock_info = None
-    stocks_data = db.get_all_stocks()['stocks']
-    for stock in stocks_data:
-        if stock['code'] == stock_code:
-            stock_info = stock
-            break
+    # 获取股票信息（股票列表走进程内缓存）；只接受股票列表中的代码，避免任意代码进入共享轮询器
+    stock_info = db.get_stock_info(stock_code)
+    if stock_info is None:
+        return render_template('realtime.html',
+                              error=f'未知的股票代码: {stock_code}',
+                              selected_code=stock_code), 404
     
-    # 获取最新数据
+    # 获取最新数据（同一股票的行情在轮询周期内共享）
     try:
-        df = get_price(stock_code, count=1, frequency='1d')
-        latest_data = {
-            'code': stock_code,
-            'name': stock_info['name'] if stock_info else stock_code,
-            'price': round(float(df.iloc[-1]['close']), 2),
-            'open': round(float(df.iloc[-1]['open']), 2),
-            'high': round(float(df.iloc[-1]['high']), 2),
-            'low': round(float(df.iloc[-1]['low']), 2),
-            'volume': int(df.iloc[-1]['volume']),
-            'time': df.index[-1].strftime('%Y-%m-%d %H:%M:%S')
-        }
-        # 计算涨跌幅
-        latest_data['change'] = round(
-            (latest_data['price'] - latest_data['open']) / latest_data['open'] * 100, 
-            2
-        )
+        latest_data = dict(quote_poller.get(stock_code), name=stock_info['name'])
     except Exception as e:
         return render_template('realtime.html', 
                               error=str(e), 
-                              stocks=stocks_data,
                               selected_code=stock_code)
     
     return render_template('realtime.html', 
                           data=latest_data, 
-                          stocks=stocks_data,
                           selected_code=stock_code)
 
 # 历史数据页面
@@ -116,160 +135,370 @@ def history():
     frequency = request.args.get('frequency', '1d')
     count = int(request.args.get('count', 30))
     
-    # 获取股票列表用于下拉选择
-    stocks_data = db.get_all_stocks()['stocks']
-    
+    # 数据库中已有该股票K线时，以最新K线时间和股票列表更新时间做缓存校验
+    latest_bar = (db.get_pipeline_latest_time(stock_code, frequency)
+                  or db.get_latest_bar_time(stock_code, frequency))
+    if latest_bar is not None:
+        stock_list_updated = db.get_stock_list_updated()
+        return conditional_page((latest_bar, stock_list_updated),
+                                max(filter(None, (latest_bar, stock_list_updated))),
+                                lambda: render_history(stock_code, frequency, count))
+    return render_history(stock_code, frequency, count)
+
+def render_history(stock_code, frequency, count):
+    """渲染历史数据页面"""
     # 获取历史数据
     try:
-        # 先从数据库获取
-        df = db.get_stock_history(stock_code, frequency, limit=count)
+        # 先从数据库获取：数据管道覆盖的股票和周期读取 stock_data，否则读取 stock_history
+        df = db.get_pipeline_history(stock_code, frequency, limit=count)
+        if df is None:
+            df = db.get_stock_history(stock_code, frequency, limit=count)
         
-        # 数据库没有则从接口获取并保存
+        # 数据库没有则从接口获取并保存（并发的相同请求只由实际取数的请求写入）
         if df is None or df.empty:
-            df = get_price(stock_code, count=count, frequency=frequency)
-            db.insert_history_data(stock_code, df, frequency)
+            df, fresh = fetch_price(stock_code, count=count, frequency=frequency)
+            if fresh:
+                db.insert_history_data(stock_code, df, frequency)
         
         # 转换数据格式
-        history_data = []
-        for index, row in df.iterrows():
-            history_data.append({
-                'time': index.strftime('%Y-%m-%d %H:%M:%S'),
-                'open': round(float(row['open']), 2),
-                'high': round(float(row['high']), 2),
-                'low': round(float(row['low']), 2),
-                'close': round(float(row['close']), 2),
-                'volume': int(row['volume']),
-                'amount': round(float(row.get('amount', 0)), 2)
-            })
+        history_data = frame_records(df, HISTORY_COLUMNS)
     except Exception as e:
+        # 错误页面返回 500，conditional_page 不为它生成缓存校验值
         return render_template('history.html', 
                               error=str(e), 
-                              stocks=stocks_data,
                               selected_code=stock_code,
-                              selected_freq=frequency)
+                              selected_freq=frequency), 500
     
     # 获取股票名称
-    stock_name = stock_code
-    for stock in stocks_data:
-        if stock['code'] == stock_code:
-            stock_name = f"{stock['name']} ({stock_code})"
-            break
+    stock_info = db.get_stock_info(stock_code)
+    stock_name = f"{stock_info['name']} ({stock_code})" if stock_info else stock_code
     
     return render_template('history.html', 
                           data=history_data, 
-                          stocks=stocks_data, 
                           selected_code=stock_code,
                           selected_freq=frequency,
                           stock_name=stock_name)
 
+# A股交易时段（开盘、收盘的时、分），用于判断最近一次可能产生新K线的时刻
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (15, 0)
+
+# 分钟线的K线时长
+MINUTE_DELTAS = {
+    '5m': timedelta(minutes=5),
+    '15m': timedelta(minutes=15),
+    '30m': timedelta(minutes=30),
+    '60m': timedelta(minutes=60),
+}
+
+def last_trading_time(now):
+    """最近一个可能有成交的时刻：工作日开盘后为当前时间（收盘后为当天收盘），否则为上一个工作日收盘
+
+    节假日按交易日处理，最多多请求一次行情接口。
+    """
+    close = now.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    if now.weekday() < 5 and now >= now.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0):
+        return min(now, close)
+    day = close - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+def period_start(value, frequency):
+    """K线所属周期的起始时间：日线为当天、周线为周一、月线为当月1日零点；分钟线即K线时间本身"""
+    if frequency in MINUTE_DELTAS:
+        return value
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if frequency == '1w':
+        return day - timedelta(days=day.weekday())
+    if frequency == '1M':
+        return day.replace(day=1)
+    return day
+
+def missing_bars(last_time, frequency, now=None):
+    """最后一根K线所在周期之后、到最近交易时刻所在周期为止的周期数（即其后可能缺少的K线数量）"""
+    latest = last_trading_time(now or datetime.now())
+    if frequency in MINUTE_DELTAS:
+        return max(int((latest - last_time) / MINUTE_DELTAS[frequency]), 0)
+    start, current = period_start(last_time, frequency), period_start(latest, frequency)
+    if frequency == '1M':
+        return max((current.year - start.year) * 12 + current.month - start.month, 0)
+    days = (current - start).days
+    return max(days // 7 if frequency == '1w' else days, 0)
+
+def period_close(value, frequency):
+    """K线所属周期的收盘时间，之后K线不再变化：日线为当天、周线为周五、月线为当月最后一个工作日的收盘；分钟线即K线时间本身"""
+    if frequency in MINUTE_DELTAS:
+        return value
+    close = value.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    if frequency == '1w':
+        return close + timedelta(days=4 - close.weekday())
+    if frequency == '1M':
+        close = (close.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        while close.weekday() >= 5:
+            close -= timedelta(days=1)
+    return close
+
+def last_bar_closed(last_time, frequency, state):
+    """最后一根已保存K线是否已收盘不再变化：保存的指标计算状态记录的取数时间在其收盘之后"""
+    fetched_at = state.get('fetched_at') if state else None
+    return fetched_at is not None and datetime.fromisoformat(fetched_at) >= period_close(last_time, frequency)
+
+def continue_indicators(engine, bars, frequency):
+    """接着 engine 的状态计算 bars 的指标，返回 (指标 DataFrame, 要保存的计算状态)
+
+    状态只推进到最后一根已收盘的K线并记录取数时间；还在变化的最后一根K线用状态的副本计算，
+    下次请求重新拉取并替换它时可以从保存的状态接着计算。
+    """
+    import pandas as pd
+    from indicators import IndicatorEngine
+    
+    now = datetime.now()
+    closed = bars if not len(bars) or now >= period_close(bars.index[-1], frequency) else bars.iloc[:-1]
+    indicators = engine.update(closed)
+    state = dict(engine.to_dict(), fetched_at=now.isoformat())
+    if len(closed) < len(bars):
+        indicators = pd.concat([indicators, IndicatorEngine.from_dict(state).update(bars.iloc[len(closed):])])
+    return indicators, state
+
+def rebuild_kline(stock_code, frequency, df, fresh, since=None):
+    """用新的指标计算状态计算 df 全部K线的指标；fresh 为 True 时保存K线、指标和计算状态
+
+    since 为数据库中还可能在变化的K线的起始时间，保存前先删除该时间及之后的旧K线和指标，用 df 中的替换。
+    """
+    from indicators import IndicatorEngine
+    
+    indicators, state = continue_indicators(IndicatorEngine(), df, frequency)
+    df = df.join(indicators)
+    if fresh:
+        if since is not None:
+            db.delete_bars_since(stock_code, frequency, since)
+        db.insert_history_data(stock_code, df, frequency)
+        db.insert_indicators(stock_code, df, frequency)
+        db.save_indicator_state(stock_code, frequency, state)
+    return df
+
+def load_kline(stock_code, frequency, count):
+    """获取K线数据和技术指标
+
+    优先读取数据库中已保存的K线和指标，从接口拉取最后一根之后的全部新K线（不按 count 截断，
+    保证数据库中的K线连续），并只保存新增的K线和指标；最后一根已保存K线在收盘后取过数之前还可能变化，
+    连同它一起重新拉取并替换它的K线和指标。数据库中K线不足 count 根时全量拉取。
+    并发的相同请求共享一次接口调用，只由实际取数的请求写入数据库。
+    数据管道 stock_data 覆盖的股票和周期直接读取其K线和 stock_indicators 中的指标，不调用行情接口。
+    """
+    # pandas 和指标计算在第一次请求K线时再导入，保持应用启动轻量
+    import pandas as pd
+    from indicators import IndicatorEngine
+    
+    pipeline = db.get_pipeline_history(stock_code, frequency, limit=count + INDICATOR_WARMUP,
+                                       with_indicators=True)
+    if pipeline is not None:
+        # 指标以 src/Compute_indicators.py 按完整历史计算的结果为准，只为尚无指标的K线临时计算
+        pending = pipeline[INDICATOR_COLUMNS].isna().all(axis=1)
+        if pending.any():
+            computed = IndicatorEngine().update(pipeline)
+            pipeline.loc[pending, INDICATOR_COLUMNS] = computed.loc[pending, INDICATOR_COLUMNS].to_numpy()
+        return pipeline.iloc[-count:]
+    
+    # 多读取 INDICATOR_WARMUP 根作为新K线指标计算的回看窗口
+    stored = db.get_stock_kline(stock_code, frequency, limit=count + INDICATOR_WARMUP)
+    if stored is None or len(stored) < count:
+        df, fresh = fetch_price(stock_code, count=count, frequency=frequency)
+        since = period_start(stored.index[-1], frequency) if stored is not None and len(stored) else None
+        return rebuild_kline(stock_code, frequency, df, fresh, since)
+    
+    # 按最后一根K线所在周期到最近交易时刻所在周期之间的周期数计算缺少的K线数量，只拉取尾部；
+    # 最后一根K线未确定收盘时连同它一起重新拉取，替换数据库中的旧值
+    last_time = stored.index[-1]
+    since = period_start(last_time, frequency)
+    state = db.get_indicator_state(stock_code, frequency)
+    last_closed = last_bar_closed(last_time, frequency, state)
+    missing = missing_bars(last_time, frequency)
+    kept = stored
+    new_bars = stored.iloc[0:0]
+    fresh = True
+    if missing > 0 or not last_closed:
+        fetched, fresh = fetch_price(stock_code, count=missing + 1, frequency=frequency)
+        if len(fetched) and period_start(fetched.index[0], frequency) > since:
+            # 接口返回的K线没有衔接到最后一根已保存K线（中间有缺口）：不能接着保存的计算状态继续，
+            # 重新拉取 count 根加缺口部分，保证返回 count 根且指标有完整的回看窗口，用新状态重新计算
+            df, fresh = fetch_price(stock_code, count=count + INDICATOR_WARMUP + missing + 1, frequency=frequency)
+            return rebuild_kline(stock_code, frequency, df, fresh, since).iloc[-count:]
+        if len(fetched) and not last_closed:
+            kept = stored[stored.index < since]
+            new_bars = fetched[fetched.index >= since]
+        else:
+            new_bars = fetched[fetched.index > last_time]
+    
+    df = pd.concat([kept, new_bars[[col for col in new_bars.columns if col in stored.columns]]])
+    # 新K线以及数据库中尚无指标的K线需要计算指标
+    pending = df[INDICATOR_COLUMNS].isna().all(axis=1)
+    if pending.any():
+        engine = IndicatorEngine.from_dict(state) if state else None
+        if (engine is not None and len(kept) and engine.last_time == kept.index[-1]
+                and not pending.iloc[:len(kept)].any()):
+            # 保存的状态正好停在保留的最后一根K线：只计算新K线
+            computed, state = continue_indicators(engine, new_bars, frequency)
+        else:
+            # 没有可用状态：用读取到的窗口重建
+            computed, state = continue_indicators(IndicatorEngine(), df, frequency)
+        df.loc[pending, INDICATOR_COLUMNS] = computed.loc[df.index[pending], INDICATOR_COLUMNS].to_numpy()
+    # 共享其他请求取到的新K线时由取数的请求负责保存
+    if pending.any() and (fresh or new_bars.empty):
+        if not new_bars.empty:
+            if len(kept) < len(stored):
+                db.delete_bars_since(stock_code, frequency, since)
+            db.insert_history_data(stock_code, new_bars, frequency)
+        db.insert_indicators(stock_code, df[pending], frequency)
+        db.save_indicator_state(stock_code, frequency, state)
+    
+    return df.iloc[-count:]
+
+def kline_buckets():
+    """按请求的图表像素宽度（width 参数）计算最多返回的K线根数，未指定时返回0（不合并）"""
+    try:
+        width = int(request.args.get('width', 0))
+    except ValueError:
+        return 0
+    return max(width // config.KLINE_BAR_PIXELS, 0)
+
 # K线图页面
 @app.route('/kline')
 def kline():
-    """高级K线图分析页面"""
+    """高级K线图分析页面
+
+    页面只渲染股票名称和查询条件，K线数据由前端按图表宽度从 /api/kline 以二进制列式格式加载
+    """
     stock_code = request.args.get('code', 'sh000001')
     frequency = request.args.get('frequency', '1d')
-    count = int(request.args.get('count', 60))
-    
-    # 获取股票列表用于下拉选择
-    stocks_data = db.get_all_stocks()['stocks']
     
+    # 页面内容只随股票列表变化
+    stock_list_updated = db.get_stock_list_updated()
+    return conditional_page(stock_list_updated, stock_list_updated,
+                            lambda: render_kline(stock_code, frequency))
+
+def render_kline(stock_code, frequency):
+    """渲染K线图页面"""
     # 获取股票名称
-    stock_name = stock_code
-    for stock in stocks_data:
-        if stock['code'] == stock_code:
-            stock_name = stock['name']
-            break
-    
-    # 获取K线数据和技术指标
-    try:
-        # 获取价格数据
-        df = get_price(stock_code, count=count, frequency=frequency)
-        # 计算技术指标
-        df = calculate_indicators(df)
-        # 保存到数据库
-        db.insert_history_data(stock_code, df, frequency)
-        db.insert_indicators(stock_code, df, frequency)
-        
-        # 转换为前端所需格式
-        kline_data = []
-        for index, row in df.iterrows():
-            kline_data.append({
-                'time': index.strftime('%Y-%m-%d %H:%M:%S'),
-                'open': round(float(row['open']), 2),
-                'high': round(float(row['high']), 2),
-                'low': round(float(row['low']), 2),
-                'close': round(float(row['close']), 2),
-                'volume': int(row['volume']),
-                'amount': round(float(row.get('amount', 0)), 2),
-                'ma5': round(float(row.get('ma5', 0)), 2) if not pd.isna(row.get('ma5')) else None,
-                'ma10': round(float(row.get('ma10', 0)), 2) if not pd.isna(row.get('ma10')) else None,
-                'ma20': round(float(row.get('ma20', 0)), 2) if not pd.isna(row.get('ma20')) else None,
-                'ma60': round(float(row.get('ma60', 0)), 2) if not pd.isna(row.get('ma60')) else None,
-                'macd': round(float(row.get('macd', 0)), 4) if not pd.isna(row.get('macd')) else None,
-                'macd_diff': round(float(row.get('macd_diff', 0)), 4) if not pd.isna(row.get('macd_diff')) else None,
-                'macd_dea': round(float(row.get('macd_dea', 0)), 4) if not pd.isna(row.get('macd_dea')) else None,
-                'rsi': round(float(row.get('rsi', 0)), 2) if not pd.isna(row.get('rsi')) else None,
-            })
-    except Exception as e:
-        return render_template('kline.html', 
-                              error=str(e), 
-                              stocks=stocks_data,
-                              selected_code=stock_code)
+    stock_info = db.get_stock_info(stock_code)
+    stock_name = stock_info['name'] if stock_info else stock_code
     
     return render_template('kline.html', 
-                          data=kline_data, 
                           stock_code=stock_code,
                           stock_name=stock_name,
-                          selected_freq=frequency,
-                          stocks=stocks_data)
+                          selected_freq=frequency)
+
+# K线数据API（列式）
+@app.route('/api/kline')
+def api_kline():
+    """按列返回K线和技术指标数据；传入 since 时只返回该时间所在周期及之后的K线（含重新拉取的最后一根），用于增量刷新；
+    传入 width（图表像素宽度）时按宽度合并K线（带 since 的增量请求不合并，返回原始K线）；
+    响应中的 downsampled 表示是否做了合并，合并过的序列只能整体重新加载。
+    Accept 优先 application/vnd.stock.columns 时返回二进制列式数据（见 serialization.frame_binary），否则返回 JSON"""
+    stock_code = request.args.get('code', 'sh000001')
+    frequency = request.args.get('frequency', '1d')
+    count = int(request.args.get('count', 60))
+    since = request.args.get('since')
+    binary = request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE
+    
+    def render():
+        df = load_kline(stock_code, frequency, count)
+        if since:
+            # 从 since 所在周期的起点筛选：重新拉取的最后一根周线、月线时间可能与 since 不同
+            df = df[df.index >= period_start(datetime.fromisoformat(since), frequency)]
+            downsampled = False
+        else:
+            merged = downsample_bars(df, kline_buckets())
+            downsampled = len(merged) < len(df)
+            df = merged
+        if binary:
+            return Response(frame_binary(df, KLINE_COLUMNS, {'code': stock_code, 'frequency': frequency,
+                                                             'downsampled': downsampled}),
+                            mimetype=BINARY_MIMETYPE)
+        return jsonify({
+            'status': 'success',
+            'code': stock_code,
+            'frequency': frequency,
+            'downsampled': downsampled,
+            'data': frame_columns(df, KLINE_COLUMNS)
+        })
+    
+    try:
+        # 以数据库中的最新K线（数据管道的还包括最新指标）时间做缓存校验，轮询刷新在没有新数据时返回 304
+        latest_bar = db.get_pipeline_latest_time(stock_code, frequency)
+        if latest_bar is not None:
+            version = (latest_bar, db.get_latest_indicator_time(stock_code, frequency))
+        else:
+            latest_bar = db.get_latest_bar_time(stock_code, frequency)
+            # 最后一根K线之后可能还有新K线、或它还未确定收盘时 load_kline 会请求行情接口，不能按数据库中的版本返回 304
+            version = latest_bar if (latest_bar is not None and missing_bars(latest_bar, frequency) <= 0
+                                     and last_bar_closed(latest_bar, frequency,
+                                                         db.get_indicator_state(stock_code, frequency))) else None
+        if version is None:
+            response = render()
+        else:
+            response = conditional_page((version, binary), latest_bar, render)
+        response.vary.add('Accept')
+        return response
+    except Exception as e:
+        # 出错的响应不带缓存校验值
+        return jsonify({'status': 'error', 'message': str(e)})
 
 # 股票筛选页面
 @app.route('/filter')
 def filter_stocks():
     """股票筛选页面"""
-    # 获取筛选参数
-    min_pe = request.args.get('min_pe', None)
-    max_pe = request.args.get('max_pe', None)
-    min_pb = request.args.get('min_pb', None)
-    max_pb = request.args.get('max_pb', None)
-    industry = request.args.get('industry', None)
-    
-    # 获取符合条件的股票（实际实现中应在数据库层实现筛选）
-    all_stocks = db.get_all_stocks(page=1, page_size=1000)['stocks']
-    filtered_stocks = []
+    # 获取筛选参数（为空或非数字的区间条件忽略）
+    def float_arg(name):
+        try:
+            return float(request.args.get(name, ''))
+        except ValueError:
+            return None
     
-    for stock in all_stocks:
-        # 筛选逻辑
-        match = True
-        
-        if min_pe and stock.get('pe') and float(stock['pe']) < float(min_pe):
-            match = False
-        if max_pe and stock.get('pe') and float(stock['pe']) > float(max_pe):
-            match = False
-        if min_pb and stock.get('pb') and float(stock['pb']) < float(min_pb):
-            match = False
-        if max_pb and stock.get('pb') and float(stock['pb']) > float(max_pb):
-            match = False
-        if industry and stock.get('industry') != industry:
-            match = False
-            
-        if match:
-            filtered_stocks.append(stock)
+    filters = {name: float_arg(name) for name in
+               ('min_pe', 'max_pe', 'min_pb', 'max_pb', 'min_market_cap', 'max_market_cap')}
+    filters['industry'] = request.args.get('industry') or None
+    order_by = request.args.get('order_by', 'code')
+    descending = request.args.get('desc') == '1'
+    page = int(request.args.get('page', 1))
     
-    # 获取所有行业用于筛选下拉框
-    industries = list(set(stock.get('industry', '未知') for stock in all_stocks))
-    industries.sort()
+    # 在数据库端筛选、排序和分页
+    stocks_data = db.screen(order_by=order_by, descending=descending,
+                            page=page, page_size=50, **filters)
     
     return render_template('filter.html', 
-                          stocks=filtered_stocks,
-                          industries=industries,
-                          filters={
-                              'min_pe': min_pe,
-                              'max_pe': max_pe,
-                              'min_pb': min_pb,
-                              'max_pb': max_pb,
-                              'industry': industry
-                          })
+                          stocks_data=stocks_data,
+                          stocks=stocks_data['stocks'],
+                          industries=db.get_industries(),
+                          filters=filters,
+                          order_by=order_by,
+                          descending=descending)
+
+# 股票搜索API
+@app.route('/api/search')
+def search_stocks():
+    """按代码前缀、名称或拼音首字母搜索股票，用于输入框自动补全"""
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', config.SEARCH_LIMIT)), config.SEARCH_MAX_LIMIT)
+    except ValueError:
+        limit = config.SEARCH_LIMIT
+    return jsonify({'status': 'success', 'results': stock_search.search(query, limit)})
+
+# 实时行情推送API（Server-Sent Events）
+@app.route('/api/quotes/stream')
+def quote_stream():
+    """订阅一只股票的实时行情，轮询器刷新到新行情时推送给客户端
+
+    只接受股票列表中的代码，避免任意代码进入共享轮询器、被转发到行情接口
+    """
+    stock_code = request.args.get('code', 'sh000001')
+    if db.get_stock_info(stock_code) is None:
+        return jsonify({'status': 'error', 'message': f'未知的股票代码: {stock_code}'}), 404
+    return Response(quote_poller.stream(stock_code),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # 自选股票API - 添加
 @app.route('/api/favorite/add/<code>')
@@ -292,21 +521,29 @@ def update_stock_list():
     try:
         # 从Ashare获取股票基本信息
         stocks = get_stock_basic()
-        for stock in stocks:
-            db.insert_stock_list(
-                code=stock['code'],
-                name=stock['name'],
-                market=stock['market'],
-                industry=stock.get('industry'),
-                pe=stock.get('pe'),
-                pb=stock.get('pb'),
-                total_market_cap=stock.get('total_market_cap')
-            )
-        return jsonify({'status': 'success', 'message': f'更新了 {len(stocks)} 只股票信息'})
+        # 一个事务内批量写入，内容未变化的股票跳过（upsert_stock_list 在有变化时使缓存失效）
+        counts = db.upsert_stock_list(stocks)
+        if counts is None:
+            return jsonify({'status': 'error', 'message': '写入股票列表失败'})
+        return jsonify({
+            'status': 'success',
+            'message': (f"共 {len(stocks)} 只股票：新增 {counts['inserted']}，"
+                        f"更新 {counts['updated']}，未变化 {counts['unchanged']}"),
+            **counts
+        })
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+# 建库建表命令：FLASK_APP=app flask init-db 或 python app.py init-db
+@app.cli.command('init-db')
+def init_db():
+    """创建数据库、数据表和索引（部署或表结构变更后执行一次）"""
+    db.migrate()
+
 # 应用入口
 if __name__ == '__main__':
-    # 启动Flask应用，允许外部访问
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if sys.argv[1:] == ['init-db']:
+        db.migrate()
+    else:
+        # 启动Flask应用，允许外部访问；多线程处理请求，数据库连接由连接池分配
+        app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
@@ -0,0 +1,174 @@
+"""
+K线表存储布局基准：对比旧版（自增 id 主键 + UNIQUE (code, time, frequency)）与
+(code, frequency, time) 聚簇主键（可选按年分区）下的批量写入和最近 N 根K线查询
+
+在配置的数据库中创建 bench_history_* 临时表，按交易日逐日写入全部股票的日线
+（与实际每日增量写入的顺序一致，旧布局下同一只股票的K线分散在不同的页中），然后：
+- 写入：整表填充及追加一个交易日的吞吐量（行/秒），使用与 insert_history_data 相同的分块 executemany
+- 查询：随机股票的 get_stock_history 查询（最近 BENCH_LIMIT 根，倒序）耗时 p50 / p95
+- 表大小：数据与索引占用
+
+环境变量：BENCH_ROWS（默认 10000000）、BENCH_CODES（默认 5000）、BENCH_QUERIES（默认 500）、
+BENCH_LIMIT（默认 250）、BENCH_PARTITION_FROM（聚簇分区表的起始年份，默认 2000，0 表示不测分区表）、
+BENCH_KEEP=1 保留基准表。
+
+用法（项目根目录）: python benchmarks/bench_history_layout.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_CONFIG, HISTORY_BATCH_SIZE
+from db_operations import HISTORY_WRITE_COLUMNS, time_series_ddl
+
+ROWS = int(os.getenv('BENCH_ROWS', 10_000_000))
+CODES = int(os.getenv('BENCH_CODES', 5000))
+QUERIES = int(os.getenv('BENCH_QUERIES', 500))
+LIMIT = int(os.getenv('BENCH_LIMIT', 250))
+PARTITION_FROM = int(os.getenv('BENCH_PARTITION_FROM', 2000))
+KEEP = os.getenv('BENCH_KEEP', '0') == '1'
+START = datetime(2000, 1, 3)
+
+# 旧版 stock_history 表结构（不含外键，基准数据不依赖 stock_list）
+LEGACY_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    code VARCHAR(20),
+    time DATETIME,
+    open FLOAT,
+    high FLOAT,
+    low FLOAT,
+    close FLOAT,
+    volume FLOAT,
+    amount FLOAT,
+    frequency VARCHAR(10),
+    UNIQUE KEY unique_record (code, time, frequency)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+INSERT = f"""
+INSERT IGNORE INTO {{table}} (code, time, {', '.join(HISTORY_WRITE_COLUMNS)}, frequency)
+VALUES (%s, %s, {', '.join(['%s'] * len(HISTORY_WRITE_COLUMNS))}, %s)
+"""
+
+# 与 StockDatabase.get_stock_history 相同的查询
+SELECT = f"""
+SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', time), {', '.join(HISTORY_WRITE_COLUMNS)}
+FROM {{table}}
+WHERE code = %s AND frequency = %s
+ORDER BY time DESC
+LIMIT %s
+"""
+
+
+def layouts():
+    result = {
+        'bench_history_legacy': LEGACY_DDL.format(table='bench_history_legacy'),
+        'bench_history_clustered': time_series_ddl('stock_history', table='bench_history_clustered',
+                                                   partition_from=0, foreign_key=False),
+    }
+    if PARTITION_FROM:
+        result['bench_history_partitioned'] = time_series_ddl(
+            'stock_history', table='bench_history_partitioned', partition_from=PARTITION_FROM)
+    return result
+
+
+def codes():
+    return [f"{'sh' if i % 2 else 'sz'}{600000 + i:06d}" for i in range(CODES)]
+
+
+def day_rows(day, code_list, rng):
+    """某个交易日全部股票的一根日线"""
+    bar_time = START + timedelta(days=day)
+    close = rng.uniform(5, 100, len(code_list)).round(2)
+    values = [close * 0.99, close * 1.02, close * 0.97, close,
+              rng.integers(10_000, 50_000_000, len(code_list)), close * 1e6]
+    return [(code, bar_time, *(float(v) for v in row), '1d')
+            for code, *row in zip(code_list, *values)]
+
+
+def write(conn, cursor, table, rows):
+    """按 HISTORY_BATCH_SIZE 分块 executemany，返回耗时"""
+    started = time.perf_counter()
+    query = INSERT.format(table=table)
+    for start in range(0, len(rows), HISTORY_BATCH_SIZE):
+        cursor.executemany(query, rows[start:start + HISTORY_BATCH_SIZE])
+    conn.commit()
+    return time.perf_counter() - started
+
+
+def fill(conn, cursor, table, code_list, days):
+    rng = np.random.default_rng(0)
+    elapsed = 0.0
+    for day in range(days):
+        elapsed += write(conn, cursor, table, day_rows(day, code_list, rng))
+        if (day + 1) % 100 == 0:
+            print(f"  {table}: {(day + 1) * len(code_list):,} 行", end='\r', flush=True)
+    return elapsed
+
+
+def query_latencies(cursor, table, code_list):
+    rng = random.Random(0)
+    query = SELECT.format(table=table)
+    latencies = []
+    for _ in range(QUERIES):
+        started = time.perf_counter()
+        cursor.execute(query, (rng.choice(code_list), '1d', LIMIT))
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - started)
+    return np.percentile(latencies, [50, 95]) * 1000
+
+
+def table_size_mb(cursor, table):
+    cursor.execute("ANALYZE TABLE " + table)
+    cursor.fetchall()
+    cursor.execute("""
+        SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    data, index = cursor.fetchone()
+    return data / 2 ** 20, index / 2 ** 20
+
+
+def main():
+    code_list = codes()
+    days = max(1, ROWS // len(code_list))
+    print(f"{days * len(code_list):,} 行（{len(code_list)} 只股票 × {days} 个交易日），"
+          f"查询 {QUERIES} 次最近 {LIMIT} 根K线")
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    results = []
+    try:
+        for table, ddl in layouts().items():
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(ddl)
+            fill_seconds = fill(conn, cursor, table, code_list, days)
+            append_seconds = write(conn, cursor, table,
+                                   day_rows(days, code_list, np.random.default_rng(1)))
+            p50, p95 = query_latencies(cursor, table, code_list)
+            data_mb, index_mb = table_size_mb(cursor, table)
+            results.append((table, days * len(code_list) / fill_seconds, len(code_list) / append_seconds,
+                            p50, p95, data_mb, index_mb))
+    finally:
+        if not KEEP:
+            for table in layouts():
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.close()
+        conn.close()
+
+    print(f"{'表':<28} {'填充 行/秒':>12} {'追加 行/秒':>12} {'查询 p50':>10} {'p95':>10} "
+          f"{'数据 MB':>10} {'索引 MB':>10}")
+    for table, fill_rate, append_rate, p50, p95, data_mb, index_mb in results:
+        print(f"{table:<28} {fill_rate:>12,.0f} {append_rate:>12,.0f} {p50:>8.2f}ms {p95:>8.2f}ms "
+              f"{data_mb:>10.1f} {index_mb:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
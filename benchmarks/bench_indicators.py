@@ -0,0 +1,38 @@
+"""
+技术指标微基准：追加一根K线时，批量重算 calculate_indicators 与 IndicatorEngine 增量计算的耗时对比
+
+用法（项目根目录）: python benchmarks/bench_indicators.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ashare import get_price, calculate_indicators, INDICATOR_COLUMNS
+from indicators import IndicatorEngine
+
+
+def main():
+    print(f"{'bars':>6} {'batch':>12} {'incremental':>12}   (毫秒/追加一根)")
+    for count in (250, 1000, 5000):
+        df = get_price('sh000001', count=count + 1, frequency='1d')
+        history, new_bar = df.iloc[:-1], df.iloc[-1:]
+
+        engine = IndicatorEngine()
+        engine.update(history)
+        state = engine.to_dict()
+        incremental = engine.update(new_bar)
+        batch = calculate_indicators(df.copy())[INDICATOR_COLUMNS].iloc[-1:]
+        assert np.allclose(incremental.to_numpy(), batch.to_numpy(), equal_nan=True)
+
+        batch_ms = min(timeit.repeat(lambda: calculate_indicators(df.copy()), number=10, repeat=3)) / 10 * 1e3
+        incremental_ms = min(timeit.repeat(
+            lambda: IndicatorEngine.from_dict(state).update(new_bar), number=100, repeat=3)) / 100 * 1e3
+        print(f"{count:>6} {batch_ms:>12.3f} {incremental_ms:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+K线序列化微基准：对比 iterrows 逐行转换与 serialization 模块的按列转换
+
+用法（项目根目录）: python benchmarks/bench_serialization.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ashare import get_price, calculate_indicators
+from serialization import KLINE_COLUMNS, frame_columns, frame_records
+
+
+def iterrows_records(df):
+    """原 kline 路由中的逐行转换"""
+    kline_data = []
+    for index, row in df.iterrows():
+        item = {
+            'time': index.strftime('%Y-%m-%d %H:%M:%S'),
+            'open': round(float(row['open']), 2),
+            'high': round(float(row['high']), 2),
+            'low': round(float(row['low']), 2),
+            'close': round(float(row['close']), 2),
+            'volume': int(row['volume']),
+            'amount': round(float(row.get('amount', 0)), 2),
+        }
+        for name, digits in KLINE_COLUMNS.items():
+            if name not in item:
+                item[name] = round(float(row.get(name, 0)), digits) if not pd.isna(row.get(name)) else None
+        kline_data.append(item)
+    return kline_data
+
+
+def per_bar_us(func, df, repeat=5):
+    number = max(1, 20000 // len(df))
+    best = min(timeit.repeat(lambda: func(df), number=number, repeat=repeat))
+    return best / number / len(df) * 1e6
+
+
+def main():
+    print(f"{'bars':>6} {'iterrows':>14} {'records':>14} {'columns':>14}   (微秒/根)")
+    for count in (60, 500, 5000):
+        df = calculate_indicators(get_price('sh000001', count=count, frequency='1d'))
+        assert iterrows_records(df) == frame_records(df, KLINE_COLUMNS)
+        print(f"{count:>6} {per_bar_us(iterrows_records, df):>14.2f} "
+              f"{per_bar_us(lambda d: frame_records(d, KLINE_COLUMNS), df):>14.2f} "
+              f"{per_bar_us(lambda d: frame_columns(d, KLINE_COLUMNS), df):>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
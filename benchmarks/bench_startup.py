@@ -0,0 +1,79 @@
+"""
+应用启动基准：在全新进程中 import app 的耗时，并检查导入过程没有副作用
+
+- 导入耗时（取多次最小值）不得超过 IMPORT_TIME_BUDGET 秒（默认 0.5）
+- 导入时不得连接数据库，也不得导入 pandas / numpy / pypinyin
+- 输出 -X importtime 中累计耗时最多的模块，便于定位新增的重依赖
+超出预算或检查失败时以非零状态退出，可放在部署流程中执行。
+
+用法（项目根目录）: python benchmarks/bench_startup.py
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', 0.5))
+DEFERRED_MODULES = ('pandas', 'numpy', 'pypinyin')
+RUNS = 5
+
+# 子进程中执行：禁止连接数据库，导入 app 并报告耗时和已加载的重依赖
+PROBE = f"""
+import sys, time
+import mysql.connector
+
+def refuse(*args, **kwargs):
+    raise SystemExit('导入 app 时连接了数据库')
+
+mysql.connector.connect = refuse
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+loaded = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]
+print(elapsed, ','.join(loaded))
+"""
+
+
+def probe():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.split('\n')[-2]
+    elapsed, _, loaded = output.partition(' ')
+    return float(elapsed), [name for name in loaded.split(',') if name]
+
+
+def top_imports(limit=10):
+    """-X importtime 输出中累计耗时最多的顶层模块"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # 只统计被 app 直接导入的模块（缩进两个空格）
+        if name.startswith('   ') and not name.startswith('    '):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    results = [probe() for _ in range(RUNS)]
+    elapsed = min(result[0] for result in results)
+    loaded = results[0][1]
+
+    print(f"import app: {elapsed * 1000:.1f}ms（预算 {BUDGET * 1000:.0f}ms，{RUNS} 次取最小值）")
+    for cumulative, name in top_imports():
+        print(f"  {cumulative / 1000:>8.1f}ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"导入时加载了应延迟导入的模块: {', '.join(loaded)}")
+        failed = True
+    if elapsed > BUDGET:
+        print("导入耗时超出预算")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,4 +15,51 @@ DB_CONFIG = {
 
 # 应用配置
 DEBUG = True
-SECRET_KEY = 'your-secret-key-here'
\ No newline at end of file
+SECRET_KEY = 'your-secret-key-here'
+
+# 数据库连接池配置
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # 最大连接数
+DB_POOL_WAIT_TIMEOUT = float(os.getenv('DB_POOL_WAIT_TIMEOUT', 10))  # 连接耗尽时的最长等待秒数
+DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', 30))  # 空闲超过该秒数的连接借出前做存活检查
+
+# 股票列表缓存有效期（秒），stock_list 每日更新一次
+STOCK_LIST_CACHE_TTL = float(os.getenv('STOCK_LIST_CACHE_TTL', 3600))
+
+# 响应压缩：小于该字节数的响应不压缩；压缩级别（gzip 1-9，brotli 0-11）
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+
+# 实时行情轮询配置
+QUOTE_POLL_INTERVAL = float(os.getenv('QUOTE_POLL_INTERVAL', 5))  # 被观看股票的行情刷新间隔（秒）
+QUOTE_SUBSCRIBER_BUFFER = int(os.getenv('QUOTE_SUBSCRIBER_BUFFER', 10))  # 每个客户端最多缓存的未发送行情数
+
+# 行情接口结果缓存（秒）：相同参数的并发请求合并为一次，结果在该时间内复用
+PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', 3))
+
+# 股票搜索接口默认及最大返回条数
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', 10))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 50))
+
+# 慢查询日志：执行时间超过该秒数的 SQL 输出语句、参数、耗时和行数（0 表示关闭）
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.5))
+
+# 请求性能分析：PROFILE_MODE 为 cpu / memory / all 时分析每个请求；
+# PROFILE_HEADER=1 时允许通过请求头 X-Profile: cpu|memory|all 分析单个请求
+PROFILE_MODE = os.getenv('PROFILE_MODE', '')
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', '0') == '1'
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# K线图每根蜡烛至少占用的像素数：请求带 width 时，K线数超过 width / KLINE_BAR_PIXELS 则在服务端合并
+KLINE_BAR_PIXELS = int(os.getenv('KLINE_BAR_PIXELS', 4))
+
+# 批量写入股票列表时每条多行 INSERT 包含的股票数
+STOCK_LIST_BATCH_SIZE = int(os.getenv('STOCK_LIST_BATCH_SIZE', 1000))
+
+# 写入历史行情和技术指标时每条多行 INSERT 包含的K线数
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', 2000))
+
+# K线和技术指标表按年份分区的起始年份（如 2010），0 表示不分区；修改后执行 FLASK_APP=app flask init-db（或 python app.py init-db）重建表
+HISTORY_PARTITION_FROM = int(os.getenv('HISTORY_PARTITION_FROM', 0))
+
+# 数据管道的 stock_data 表不存在时，间隔该秒数后再尝试读取
+PIPELINE_RETRY_INTERVAL = float(os.getenv('PIPELINE_RETRY_INTERVAL', 600))
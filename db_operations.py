@@ -1,46 +1,425 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import errorcode
-import pandas as pd
 from datetime import datetime
-from config import DB_CONFIG
+from metrics import current_query_method, record_cache, record_query_error, record_rows, timed_query
+from config import (DB_CONFIG, DB_POOL_SIZE, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_INTERVAL,
+                    STOCK_LIST_CACHE_TTL, SLOW_QUERY_THRESHOLD, STOCK_LIST_BATCH_SIZE, HISTORY_BATCH_SIZE,
+                    HISTORY_PARTITION_FROM, PIPELINE_RETRY_INTERVAL)
+
+# stock_list 上用于筛选的二级索引 {索引名: 列}
+STOCK_LIST_INDEXES = {
+    'idx_industry_pe': 'industry, pe',
+    'idx_pe': 'pe',
+    'idx_pb': 'pb',
+    'idx_market_cap': 'total_market_cap',
+}
+
+# stock_list 中后续版本新增的列，migrate() 时为已存在的表补齐
+STOCK_LIST_ADDED_COLUMNS = {
+    'content_hash': 'CHAR(40) NULL',
+}
+
+# 参与内容哈希的 stock_list 字段：这些字段都未变化的股票在批量更新时跳过
+STOCK_LIST_CONTENT_FIELDS = ('name', 'market', 'industry', 'pe', 'pb', 'total_market_cap')
+
+# screen() 允许的排序字段
+SCREEN_ORDER_COLUMNS = ('code', 'pe', 'pb', 'total_market_cap')
+
+# 数据管道 stock_data.cycle 与页面 frequency 的对应关系
+CYCLE_FREQUENCIES = {
+    'daily': '1d',
+    'weekly': '1w',
+    'monthly': '1M',
+    'quarterly': '1Q',
+    'yearly': '1Y',
+}
+FREQUENCY_CYCLES = {frequency: cycle for cycle, frequency in CYCLE_FREQUENCIES.items()}
+
+# stock_data 上按股票、周期取最近K线的覆盖索引（主键为 (ts_code, trade_date, cycle)，
+# 按周期过滤时需扫描该股票全部周期的行并回表）
+STOCK_DATA_INDEXES = {
+    'idx_code_cycle_date': 'ts_code, cycle, trade_date, open, high, low, close, vol, amount',
+}
+
+
+def stock_content_hash(record):
+    """股票基本信息的内容哈希（SHA-1 十六进制）"""
+    values = [record.get(field) for field in STOCK_LIST_CONTENT_FIELDS]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+# 历史行情与技术指标写入的数据列（与 INSERT 语句中的列顺序一致）
+HISTORY_WRITE_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+INDICATOR_WRITE_COLUMNS = ('ma5', 'ma10', 'ma20', 'ma60', 'macd', 'macd_diff', 'macd_dea',
+                           'rsi', 'kdj_k', 'kdj_d', 'kdj_j')
+
+# 时序表（K线、技术指标）按 (code, frequency, time) 聚簇存储：
+# 查询某只股票某周期最近 N 根K线时沿主键倒序扫描连续的页，不再经二级索引回表。
+# frequency 使用 ascii_bin，区分 1m（分钟）与 1M（月）且每个字符只占 1 字节。
+TIME_SERIES_KEY_COLUMNS = """
+            code VARCHAR(20) NOT NULL,
+            frequency VARCHAR(4) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+            time DATETIME NOT NULL,"""
+
+TIME_SERIES_DDL = {
+    'stock_history': """
+        CREATE TABLE IF NOT EXISTS {table} ({key_columns}
+            open FLOAT,
+            high FLOAT,
+            low FLOAT,
+            close FLOAT,
+            volume FLOAT,
+            amount FLOAT,  -- 成交额
+            PRIMARY KEY (code, frequency, time){foreign_key}
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4{partitioning};
+        """,
+    'stock_indicators': """
+        CREATE TABLE IF NOT EXISTS {table} ({key_columns}
+            ma5 FLOAT,     -- 5日均线
+            ma10 FLOAT,    -- 10日均线
+            ma20 FLOAT,    -- 20日均线
+            ma60 FLOAT,    -- 60日均线
+            macd FLOAT,    -- MACD
+            macd_diff FLOAT, -- MACD差离值
+            macd_dea FLOAT,  -- MACD信号线
+            rsi FLOAT,     -- RSI相对强弱指数
+            kdj_k FLOAT,   -- KDJ-K值
+            kdj_d FLOAT,   -- KDJ-D值
+            kdj_j FLOAT,   -- KDJ-J值
+            PRIMARY KEY (code, frequency, time){foreign_key}
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4{partitioning};
+        """,
+}
+
+TIME_SERIES_VALUE_COLUMNS = {
+    'stock_history': HISTORY_WRITE_COLUMNS,
+    'stock_indicators': INDICATOR_WRITE_COLUMNS,
+}
+
+
+def time_series_ddl(name, table=None, partition_from=HISTORY_PARTITION_FROM, foreign_key=True):
+    """时序表的建表语句
+
+    partition_from 大于 0 时按 YEAR(time) 从该年起逐年分区（当前年份之后的数据落入 pmax）。
+    MySQL 的分区表不支持外键，分区时省略到 stock_list 的外键。
+    """
+    partitioning = ''
+    if partition_from:
+        partitions = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})"
+                      for year in range(partition_from, datetime.now().year + 1)]
+        partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        partitioning = "\n        PARTITION BY RANGE (YEAR(time)) (\n            " + ",\n            ".join(partitions) + "\n        )"
+    return TIME_SERIES_DDL[name].format(
+        table=table or name,
+        key_columns=TIME_SERIES_KEY_COLUMNS,
+        foreign_key='' if partition_from or not foreign_key else
+        ",\n            FOREIGN KEY (code) REFERENCES stock_list(code)",
+        partitioning=partitioning)
+
+
+def frame_chunks(code, df, columns, frequency, size):
+    """把 DataFrame 按 size 行一块转换为 (code, time, *columns, frequency) 参数元组列表
+
+    每块按列整体转换：数值转为 Python 原生类型，NaN 替换为 None（MySQL 识别为 NULL），
+    缺失的列整列为 None。逐块生成，内存占用与块大小而非总行数相关。
+    """
+    for start in range(0, len(df), size):
+        chunk = df.iloc[start:start + size]
+        index = chunk.index
+        times = index.to_pydatetime().tolist() if hasattr(index, 'to_pydatetime') else index.tolist()
+        values = []
+        for column in columns:
+            if column not in chunk:
+                values.append([None] * len(chunk))
+                continue
+            series = chunk[column]
+            array = series.to_numpy(dtype=object)
+            array[series.isna().to_numpy()] = None
+            values.append(array.tolist())
+        yield [(code, time, *row, frequency) for time, *row in zip(times, *values)]
+
+
+def rows_to_columns(rows, names, as_frame=True):
+    """把按时间倒序的 (秒数, 数值...) 元组转为按时间升序的列
+
+    预分配 (列数, 行数) 的 float64 数组，逐列整体赋值并在赋值时反转为升序（None 由 NumPy 转为 NaN），
+    不经过字典和逐行的 DataFrame 构造。as_frame 为 True 时返回以 time 为索引的 DataFrame，
+    否则返回 {'time': datetime64 数组, 列名: float64 数组, ...}。
+    """
+    import numpy as np
+    matrix = np.empty((len(names) + 1, len(rows)))
+    for i, column in enumerate(zip(*rows)):
+        matrix[i, ::-1] = column
+    times = matrix[0].astype(np.int64).astype('datetime64[s]').astype('datetime64[ns]')
+    if not as_frame:
+        return {'time': times, **{name: matrix[i + 1] for i, name in enumerate(names)}}
+    import pandas as pd
+    # 转置为视图，DataFrame 直接使用按列存放的数组
+    return pd.DataFrame(matrix[1:].T, index=pd.DatetimeIndex(times, name='time'), columns=list(names))
+
+
+def ts_code_to_code(ts_code):
+    """数据管道的 ts_code（600519.SH）转为 stock_list 的代码（sh600519）"""
+    symbol, _, exchange = ts_code.partition('.')
+    return f"{exchange.lower()}{symbol}"
+
+
+def code_to_ts_code(code):
+    """stock_list 的代码（sh600519）转为数据管道的 ts_code（600519.SH）"""
+    return f"{code[2:]}.{code[:2].upper()}"
+
+
+class ConnectionPool:
+    """有界MySQL连接池
+
+    每次数据库操作借出一个连接、用完归还；空闲超过 ping_interval 秒的连接
+    在借出前做存活检查，失效或出错的连接直接丢弃，下次借出时重新建立。
+    连接数达到上限时最多等待 wait_timeout 秒，超时抛出 PoolError。
+    """
+
+    def __init__(self, pool_size=DB_POOL_SIZE, wait_timeout=DB_POOL_WAIT_TIMEOUT,
+                 ping_interval=DB_POOL_PING_INTERVAL, **config):
+        self.pool_size = pool_size
+        self.wait_timeout = wait_timeout
+        self.ping_interval = ping_interval
+        self._config = config
+        self._slots = threading.BoundedSemaphore(pool_size)
+        # 空闲连接 (connection, 归还时间)，后进先出以便复用最近活跃的连接
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        """借出一个可用连接"""
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise mysql.connector.errors.PoolError(
+                f"等待数据库连接超时（{self.wait_timeout}秒，连接池大小 {self.pool_size}）")
+        try:
+            while True:
+                try:
+                    conn, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    return mysql.connector.connect(**self._config)
+                if time.monotonic() - released_at < self.ping_interval:
+                    return conn
+                try:
+                    conn.ping(reconnect=True, attempts=1, delay=0)
+                    return conn
+                except mysql.connector.Error:
+                    self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """归还连接；broken=True 时直接关闭，不再放回池中"""
+        try:
+            if not broken:
+                try:
+                    # 结束未提交的隐式事务，避免下个使用者读到旧快照
+                    if conn.in_transaction:
+                        conn.rollback()
+                except mysql.connector.Error:
+                    broken = True
+            if broken:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+
+class StockListCache:
+    """stock_list 的进程内快照
+
+    stocks 为按代码排序的列表（供下拉框使用），industries 为排序后的行业列表，
+    last_updated 为全表最新的 last_updated（用于页面缓存校验），get(code) 按代码查找。快照超过 ttl 秒或被 invalidate() 后，下次读取时
+    重新从数据库加载。快照中的字典由所有请求共享，调用方不应修改。
+    """
+
+    def __init__(self, loader, ttl=STOCK_LIST_CACHE_TTL):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (stocks, by_code, industries, last_updated, 加载时间)，整体替换以保证读取线程看到一致的快照
+        self._snapshot = None
+        # 每次 invalidate() 递增；加载期间发生失效时，加载结果立即视为过期
+        self._generation = 0
+
+    def _fresh(self, snapshot):
+        return snapshot is not None and time.monotonic() - snapshot[-1] < self.ttl
+
+    def _load(self):
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            record_cache('stock_list', True)
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):  # 其他线程已完成加载
+                record_cache('stock_list', True)
+                return snapshot
+            record_cache('stock_list', False)
+            generation = self._generation
+            stocks = self._loader()
+            if stocks is None:
+                # 加载失败：沿用旧快照（若有），下次读取时重试
+                return snapshot or ([], {}, [], None, float('-inf'))
+            by_code = {stock['code']: stock for stock in stocks}
+            industries = sorted({stock['industry'] for stock in stocks if stock.get('industry')})
+            last_updated = max((stock['last_updated'] for stock in stocks if stock.get('last_updated')),
+                               default=None)
+            loaded_at = time.monotonic() if generation == self._generation else float('-inf')
+            snapshot = (stocks, by_code, industries, last_updated, loaded_at)
+            self._snapshot = snapshot
+            return snapshot
+
+    @property
+    def stocks(self):
+        return self._load()[0]
+
+    @property
+    def industries(self):
+        return self._load()[2]
+
+    @property
+    def last_updated(self):
+        return self._load()[3]
+
+    def get(self, code):
+        return self._load()[1].get(code)
+
+    def invalidate(self):
+        """使快照失效，下次读取时重新加载"""
+        self._generation += 1
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self._snapshot = snapshot[:-1] + (float('-inf'),)
+
+
+class TimedCursor:
+    """游标包装：统计每条语句的耗时和行数，超过 SLOW_QUERY_THRESHOLD 秒的语句输出慢查询日志"""
+
+    def __init__(self, cursor, threshold=SLOW_QUERY_THRESHOLD):
+        self._cursor = cursor
+        self.threshold = threshold
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None):
+        started = time.perf_counter()
+        result = self._cursor.execute(operation, params)
+        self._record(operation, params, time.perf_counter() - started)
+        return result
+
+    def executemany(self, operation, seq_params):
+        seq_params = seq_params if isinstance(seq_params, (list, tuple)) else list(seq_params)
+        started = time.perf_counter()
+        result = self._cursor.executemany(operation, seq_params)
+        # 批量语句只记录批次大小和第一组参数
+        params = f"{len(seq_params)} 组，首组 {seq_params[0]!r}" if seq_params else '0 组'
+        self._record(operation, params, time.perf_counter() - started)
+        return result
+
+    def _record(self, operation, params, duration):
+        rows = self._cursor.rowcount
+        record_rows(rows)
+        if self.threshold and duration >= self.threshold:
+            sql = ' '.join(str(operation).split())
+            print(f"慢查询 {duration * 1000:.1f}ms [{current_query_method() or '-'}] "
+                  f"行数={rows} SQL: {sql[:1000]} 参数: {str(params)[:500]}")
+
 
 class StockDatabase:
+    """股票数据访问层
+
+    创建实例不会连接数据库：连接池在第一次查询时创建，
+    建库建表由 migrate()（命令行 FLASK_APP=app flask init-db 或 python app.py init-db）显式执行。
+    """
+
     def __init__(self):
-        self.connection = None
-        self.connect()
-        self.create_tables()
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self.stock_cache = StockListCache(self._load_stock_list)
+        # stock_data 表不存在（未部署数据管道）时，在此时间之前不再查询
+        self._pipeline_missing_until = 0
     
     def connect(self):
-        """连接到MySQL数据库"""
+        """创建MySQL连接池（不预先建立连接）"""
+        with self._pool_lock:
+            if self.pool is None:
+                self.pool = ConnectionPool(**DB_CONFIG)
+        return self.pool
+    
+    def migrate(self):
+        """建库建表：数据库不存在时创建，再创建缺少的表和索引"""
+        conn = mysql.connector.connect(
+            host=DB_CONFIG['host'],
+            user=DB_CONFIG['user'],
+            password=DB_CONFIG['password'],
+            port=DB_CONFIG['port']
+        )
         try:
-            self.connection = mysql.connector.connect(**DB_CONFIG)
-            print("数据库连接成功")
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-                print("用户名或密码错误")
-            elif err.errno == errorcode.ER_BAD_DB_ERROR:
-                print("数据库不存在，正在创建...")
-                # 创建数据库
-                temp_conn = mysql.connector.connect(
-                    host=DB_CONFIG['host'],
-                    user=DB_CONFIG['user'],
-                    password=DB_CONFIG['password'],
-                    port=DB_CONFIG['port']
-                )
-                cursor = temp_conn.cursor()
-                cursor.execute(f"CREATE DATABASE {DB_CONFIG['database']}")
-                temp_conn.close()
-                self.connect()  # 重新连接
-            else:
-                print(err)
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
+            cursor.close()
+        finally:
+            conn.close()
+        self.create_tables()
+    
+    @contextmanager
+    def _cursor(self, dictionary=False):
+        """从连接池借出连接并打开游标，操作结束后归还连接；第一次调用时创建连接池"""
+        conn = (self.pool or self.connect()).acquire()
+        cursor = None
+        broken = False
+        try:
+            cursor = TimedCursor(conn.cursor(dictionary=dictionary, buffered=True))
+            yield conn, cursor
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            # 连接层面的错误（断线、超时等），丢弃该连接，下次借出时重连
+            broken = True
+            record_query_error()
+            raise
+        except mysql.connector.Error:
+            record_query_error()
+            raise
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except mysql.connector.Error:
+                    broken = True
+            self.pool.release(conn, broken=broken)
     
+    @timed_query
     def create_tables(self):
         """创建必要的数据库表"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor()
-        
         # 股票列表 table - 存储全部股票
         stock_list_table = """
         CREATE TABLE IF NOT EXISTS stock_list (
@@ -51,7 +430,12 @@ class StockDatabase:
             pe FLOAT,  -- 新增：市盈率
             pb FLOAT,  -- 新增：市净率
             total_market_cap FLOAT,  -- 新增：总市值
-            last_updated DATETIME
+            last_updated DATETIME,
+            content_hash CHAR(40) NULL,  -- 基本信息的内容哈希，批量更新时跳过未变化的股票
+            KEY idx_industry_pe (industry, pe),  -- 筛选：行业 + 市盈率区间
+            KEY idx_pe (pe),
+            KEY idx_pb (pb),
+            KEY idx_market_cap (total_market_cap)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
         
@@ -67,106 +451,276 @@ class StockDatabase:
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
         
-        # 股票历史数据 table
-        stock_history_table = """
-        CREATE TABLE IF NOT EXISTS stock_history (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+        # 增量指标计算状态 table - 每只股票每个周期一行（JSON）
+        indicator_state_table = """
+        CREATE TABLE IF NOT EXISTS indicator_state (
             code VARCHAR(20),
-            time DATETIME,
-            open FLOAT,
-            high FLOAT,
-            low FLOAT,
-            close FLOAT,
-            volume FLOAT,
-            amount FLOAT,  -- 新增：成交额
             frequency VARCHAR(10),
-            UNIQUE KEY unique_record (code, time, frequency),
-            FOREIGN KEY (code) REFERENCES stock_list(code)
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-        """
-        
-        # 新增：股票技术指标表
-        stock_indicators_table = """
-        CREATE TABLE IF NOT EXISTS stock_indicators (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            code VARCHAR(20),
-            time DATETIME,
-            ma5 FLOAT,     -- 5日均线
-            ma10 FLOAT,    -- 10日均线
-            ma20 FLOAT,    -- 20日均线
-            ma60 FLOAT,    -- 60日均线
-            macd FLOAT,    -- MACD
-            macd_diff FLOAT, -- MACD差离值
-            macd_dea FLOAT,  -- MACD信号线
-            rsi FLOAT,     -- RSI相对强弱指数
-            kdj_k FLOAT,   -- KDJ-K值
-            kdj_d FLOAT,   -- KDJ-D值
-            kdj_j FLOAT,   -- KDJ-J值
-            frequency VARCHAR(10),
-            UNIQUE KEY unique_indicator (code, time, frequency),
-            FOREIGN KEY (code) REFERENCES stock_list(code)
+            last_time DATETIME,  -- 状态对应的最后一根K线时间
+            state TEXT,
+            updated_at DATETIME,
+            PRIMARY KEY (code, frequency)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
         
         try:
-            cursor.execute(stock_list_table)
-            cursor.execute(favorite_stocks_table)
-            cursor.execute(stock_history_table)
-            cursor.execute(stock_indicators_table)
-            self.connection.commit()
+            with self._cursor() as (conn, cursor):
+                cursor.execute(stock_list_table)
+                cursor.execute(favorite_stocks_table)
+                for name in TIME_SERIES_DDL:
+                    cursor.execute(time_series_ddl(name))
+                cursor.execute(indicator_state_table)
+                # 旧库中已存在的表不会经过 CREATE TABLE，补建缺失的索引
+                self._ensure_columns(cursor, 'stock_list', STOCK_LIST_ADDED_COLUMNS)
+                self._ensure_indexes(cursor, 'stock_list', STOCK_LIST_INDEXES)
+                # stock_data 由数据管道（src/Upload_mysql.py）创建，已存在时补建读取用的覆盖索引
+                cursor.execute("SHOW TABLES LIKE 'stock_data'")
+                if cursor.fetchall():
+                    self._ensure_indexes(cursor, 'stock_data', STOCK_DATA_INDEXES)
+                conn.commit()
+                # 旧版时序表（自增 id 主键）或分区设置变化时重建为聚簇布局
+                for name in TIME_SERIES_DDL:
+                    self._ensure_time_series_layout(conn, cursor, name)
             print("数据表创建成功")
         except mysql.connector.Error as err:
             print(f"创建表时出错: {err}")
-        finally:
-            cursor.close()
+    
+    @staticmethod
+    def _ensure_columns(cursor, table, columns):
+        """为已存在的表补建缺失的列，columns 为 {列名: 列定义}"""
+        cursor.execute(f"SHOW COLUMNS FROM {table}")
+        existing = {row[0] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                print(f"已为 {table} 添加列 {name}")
+    
+    @staticmethod
+    def _ensure_indexes(cursor, table, indexes):
+        """为已存在的表补建缺失的二级索引，indexes 为 {索引名: 列定义}"""
+        cursor.execute(f"SHOW INDEX FROM {table}")
+        existing = {row[2] for row in cursor.fetchall()}  # 第3列为 Key_name
+        for name, columns in indexes.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+                print(f"已为 {table} 创建索引 {name}")
+    
+    @staticmethod
+    def _ensure_time_series_layout(conn, cursor, name):
+        """时序表不是 (code, frequency, time) 聚簇主键或分区设置与 HISTORY_PARTITION_FROM 不符时重建
+
+        新表建为 <表名>_new，按股票逐只 INSERT ... SELECT 复制（每只一个事务，去掉键列为空的行），
+        再用一条 RENAME TABLE 原子切换；原表保留为 <表名>_legacy_<时间>，确认无误后可手动删除。
+        """
+        cursor.execute(f"SHOW COLUMNS FROM {name}")
+        legacy = 'id' in {row[0] for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        """, (name,))
+        partitioned = cursor.fetchone()[0] > 0
+        if not legacy and partitioned == bool(HISTORY_PARTITION_FROM):
+            return
+        
+        started = time.perf_counter()
+        staging = f"{name}_new"
+        backup = f"{name}_legacy_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        columns = ', '.join(('code', 'frequency', 'time', *TIME_SERIES_VALUE_COLUMNS[name]))
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(time_series_ddl(name, table=staging))
+        cursor.execute(f"SELECT DISTINCT code FROM {name} WHERE code IS NOT NULL")
+        codes = [row[0] for row in cursor.fetchall()]
+        for code in codes:
+            cursor.execute(f"""
+                INSERT IGNORE INTO {staging} ({columns})
+                SELECT {columns} FROM {name}
+                WHERE code = %s AND frequency IS NOT NULL AND time IS NOT NULL
+            """, (code,))
+            conn.commit()
+        cursor.execute(f"RENAME TABLE {name} TO {backup}, {staging} TO {name}")
+        print(f"已将 {name} 重建为 (code, frequency, time) 聚簇布局（{len(codes)} 只股票，"
+              f"耗时 {time.perf_counter() - started:.1f}s），原表保留为 {backup}")
     
     # 股票列表相关操作
     def insert_stock_list(self, code, name, market, industry=None, pe=None, pb=None, total_market_cap=None):
-        """插入或更新股票基本信息"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor()
+        """插入或更新单只股票基本信息"""
+        self.upsert_stock_list([{
+            'code': code, 'name': name, 'market': market, 'industry': industry,
+            'pe': pe, 'pb': pb, 'total_market_cap': total_market_cap,
+        }])
+    
+    @timed_query
+    def upsert_stock_list(self, records):
+        """批量插入或更新股票基本信息
+
+        records 为含 code 及 STOCK_LIST_CONTENT_FIELDS 字段的字典列表。先读取全部已有股票的内容哈希，
+        内容未变化的股票直接跳过（不更新 last_updated），其余按 STOCK_LIST_BATCH_SIZE 行一批写入，
+        整体在一个事务中提交。返回 {'inserted': n, 'updated': n, 'unchanged': n}，出错时返回 None。
+        """
+        query = """
+        INSERT INTO stock_list 
+        (code, name, market, industry, pe, pb, total_market_cap, last_updated, content_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        name = VALUES(name),
+        market = VALUES(market),
+        industry = VALUES(industry),
+        pe = VALUES(pe),
+        pb = VALUES(pb),
+        total_market_cap = VALUES(total_market_cap),
+        last_updated = VALUES(last_updated),
+        content_hash = VALUES(content_hash)
+        """
+        # 同一代码出现多次时以最后一条为准
+        records = {record['code']: record for record in records}
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
         try:
-            query = """
-            INSERT INTO stock_list 
-            (code, name, market, industry, pe, pb, total_market_cap, last_updated)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-            name = VALUES(name),
-            market = VALUES(market),
-            industry = VALUES(industry),
-            pe = VALUES(pe),
-            pb = VALUES(pb),
-            total_market_cap = VALUES(total_market_cap),
-            last_updated = VALUES(last_updated)
-            """
-            cursor.execute(query, (code, name, market, industry, pe, pb, total_market_cap, datetime.now()))
-            self.connection.commit()
+            with self._cursor() as (conn, cursor):
+                cursor.execute("SELECT code, content_hash FROM stock_list")
+                existing = dict(cursor.fetchall())
+                
+                now = datetime.now()
+                rows = []
+                for code, record in records.items():
+                    content_hash = stock_content_hash(record)
+                    if code not in existing:
+                        counts['inserted'] += 1
+                    elif existing[code] == content_hash:
+                        counts['unchanged'] += 1
+                        continue
+                    else:
+                        counts['updated'] += 1
+                    rows.append((code, *(record.get(field) for field in STOCK_LIST_CONTENT_FIELDS),
+                                 now, content_hash))
+                
+                # executemany 会把 INSERT 改写为多行 VALUES，一批一次往返
+                for start in range(0, len(rows), STOCK_LIST_BATCH_SIZE):
+                    cursor.executemany(query, rows[start:start + STOCK_LIST_BATCH_SIZE])
+                conn.commit()
         except mysql.connector.Error as err:
-            print(f"插入股票列表出错: {err}")
-        finally:
-            cursor.close()
+            print(f"批量更新股票列表出错: {err}")
+            return None
+        if rows:
+            self.stock_cache.invalidate()
+        return counts
     
-    def get_all_stocks(self, page=1, page_size=20):
-        """分页获取全部股票列表"""
-        if not self.connection:
-            self.connect()
+    @timed_query
+    def get_all_stocks(self, page=1, page_size=20, after_code=None):
+        """分页获取全部股票列表
+
+        使用按代码的游标分页：after_code 为上一页最后一只股票的代码，只返回其后的 page_size 只；
+        未传 after_code 时由缓存的有序股票列表换算出第 page 页的起始代码。
+        总数取自股票列表缓存（stock_list 写入后失效），不再每次 COUNT(*)。
+        """
+        cached = self.stock_cache.stocks
+        total = len(cached)
+        if after_code is None and page > 1:
+            boundary = (page - 1) * page_size - 1
+            after_code = cached[boundary]['code'] if boundary < total else None
+            if after_code is None:
+                return {'stocks': [], 'total': total, 'page': page, 'page_size': page_size,
+                        'total_pages': (total + page_size - 1) // page_size}
+        try:
+            with self._cursor(dictionary=True) as (conn, cursor):
+                if after_code is None:
+                    cursor.execute("""
+                        SELECT * FROM stock_list 
+                        ORDER BY code 
+                        LIMIT %s
+                    """, (page_size,))
+                else:
+                    cursor.execute("""
+                        SELECT * FROM stock_list 
+                        WHERE code > %s
+                        ORDER BY code 
+                        LIMIT %s
+                    """, (after_code, page_size))
+                stocks = cursor.fetchall()
             
+            return {
+                'stocks': stocks,
+                'total': total,
+                'page': page,
+                'page_size': page_size,
+                'total_pages': (total + page_size - 1) // page_size
+            }
+        except mysql.connector.Error as err:
+            print(f"获取全部股票出错: {err}")
+            return {'stocks': [], 'total': 0, 'page': page, 'page_size': page_size, 'total_pages': 0,
+                    'error': str(err)}
+    
+    @timed_query
+    def _load_stock_list(self):
+        """读取完整的 stock_list（按代码排序），供 StockListCache 加载快照"""
+        try:
+            with self._cursor(dictionary=True) as (conn, cursor):
+                cursor.execute("SELECT * FROM stock_list ORDER BY code")
+                return cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"加载股票列表缓存出错: {err}")
+            return None
+    
+    def get_stock_list(self):
+        """获取全部股票（缓存，按代码排序），用于下拉选择"""
+        return self.stock_cache.stocks
+    
+    def get_stock_info(self, code):
+        """按代码获取股票基本信息（缓存），不存在时返回 None"""
+        return self.stock_cache.get(code)
+    
+    def get_stock_list_updated(self):
+        """stock_list 最近一次更新时间（缓存），用于页面缓存校验"""
+        return self.stock_cache.last_updated
+    
+    def invalidate_stock_list(self):
+        """股票列表变更后使缓存失效"""
+        self.stock_cache.invalidate()
+    
+    def get_industries(self):
+        """获取全部行业（缓存，已排序），用于筛选下拉框"""
+        return self.stock_cache.industries
+    
+    @timed_query
+    def screen(self, min_pe=None, max_pe=None, min_pb=None, max_pb=None,
+               min_market_cap=None, max_market_cap=None, industry=None,
+               order_by='code', descending=False, page=1, page_size=50):
+        """按市盈率、市净率、总市值区间和行业筛选股票，在数据库端完成排序和分页
+
+        参数为 None 的条件不参与筛选；设置了区间条件时，该字段为空的股票不会入选。
+        返回结构与 get_all_stocks 相同。
+        """
+        conditions = []
+        params = []
+        for column, low, high in (('pe', min_pe, max_pe),
+                                  ('pb', min_pb, max_pb),
+                                  ('total_market_cap', min_market_cap, max_market_cap)):
+            if low is not None:
+                conditions.append(f"{column} >= %s")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{column} <= %s")
+                params.append(high)
+        if industry:
+            conditions.append("industry = %s")
+            params.append(industry)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # 排序字段只允许白名单中的列，code 作为次序键保证分页稳定
+        if order_by not in SCREEN_ORDER_COLUMNS:
+            order_by = 'code'
+        direction = 'DESC' if descending else 'ASC'
+        order = f"{order_by} {direction}" if order_by == 'code' else f"{order_by} {direction}, code"
         offset = (page - 1) * page_size
-        cursor = self.connection.cursor(dictionary=True)
         try:
-            # 获取总数
-            cursor.execute("SELECT COUNT(*) as total FROM stock_list")
-            total = cursor.fetchone()['total']
-            
-            # 获取分页数据
-            cursor.execute("""
-                SELECT * FROM stock_list 
-                ORDER BY code 
-                LIMIT %s OFFSET %s
-            """, (page_size, offset))
-            stocks = cursor.fetchall()
+            with self._cursor(dictionary=True) as (conn, cursor):
+                cursor.execute(f"SELECT COUNT(*) AS total FROM stock_list {where}", tuple(params))
+                total = cursor.fetchone()['total']
+                cursor.execute(f"""
+                    SELECT * FROM stock_list {where}
+                    ORDER BY {order}
+                    LIMIT %s OFFSET %s
+                """, (*params, page_size, offset))
+                stocks = cursor.fetchall()
             
             return {
                 'stocks': stocks,
@@ -176,18 +730,13 @@ class StockDatabase:
                 'total_pages': (total + page_size - 1) // page_size
             }
         except mysql.connector.Error as err:
-            print(f"获取全部股票出错: {err}")
+            print(f"筛选股票出错: {err}")
             return {'stocks': [], 'total': 0, 'page': page, 'page_size': page_size, 'total_pages': 0}
-        finally:
-            cursor.close()
     
     # 自选股票相关操作
+    @timed_query
     def add_favorite(self, code, notes=""):
         """添加股票到自选列表"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor()
         try:
             query = """
             INSERT INTO favorite_stocks (code, added_time, notes)
@@ -196,179 +745,370 @@ class StockDatabase:
             added_time = VALUES(added_time),
             notes = VALUES(notes)
             """
-            cursor.execute(query, (code, datetime.now(), notes))
-            self.connection.commit()
+            with self._cursor() as (conn, cursor):
+                cursor.execute(query, (code, datetime.now(), notes))
+                conn.commit()
             return True
         except mysql.connector.Error as err:
             print(f"添加自选股票出错: {err}")
             return False
-        finally:
-            cursor.close()
     
+    @timed_query
     def remove_favorite(self, code):
         """从自选列表移除股票"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor()
         try:
             query = "DELETE FROM favorite_stocks WHERE code = %s"
-            cursor.execute(query, (code,))
-            self.connection.commit()
-            return cursor.rowcount > 0
+            with self._cursor() as (conn, cursor):
+                cursor.execute(query, (code,))
+                conn.commit()
+                return cursor.rowcount > 0
         except mysql.connector.Error as err:
             print(f"移除自选股票出错: {err}")
             return False
-        finally:
-            cursor.close()
     
+    @timed_query
     def get_favorite_stocks(self):
         """获取所有自选股票"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor(dictionary=True)
         try:
-            cursor.execute("""
-                SELECT s.*, f.added_time, f.notes 
-                FROM favorite_stocks f
-                JOIN stock_list s ON f.code = s.code
-                ORDER BY f.added_time DESC
-            """)
-            return cursor.fetchall()
+            with self._cursor(dictionary=True) as (conn, cursor):
+                cursor.execute("""
+                    SELECT s.*, f.added_time, f.notes 
+                    FROM favorite_stocks f
+                    JOIN stock_list s ON f.code = s.code
+                    ORDER BY f.added_time DESC
+                """)
+                return cursor.fetchall()
         except mysql.connector.Error as err:
             print(f"获取自选股票出错: {err}")
             return []
-        finally:
-            cursor.close()
     
     def is_favorite(self, code):
         """检查股票是否在自选列表中"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor(dictionary=True)
+        return code in self.get_favorite_codes([code])
+    
+    @timed_query
+    def get_favorites_version(self):
+        """自选列表的版本标识 (数量, 最近加入时间)，增删自选后会变化"""
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute("SELECT COUNT(*), MAX(added_time) FROM favorite_stocks")
+                return cursor.fetchone()
+        except mysql.connector.Error as err:
+            print(f"获取自选版本出错: {err}")
+            return None
+    
+    @timed_query
+    def get_favorite_codes(self, codes=None):
+        """批量检查自选：返回 codes 中属于自选列表的代码集合，codes 为 None 时返回全部自选代码
+
+        无论 codes 有多少个，只执行一次查询。
+        """
+        if codes is not None:
+            codes = list(dict.fromkeys(codes))
+            if not codes:
+                return set()
         try:
-            cursor.execute("SELECT * FROM favorite_stocks WHERE code = %s", (code,))
-            return cursor.fetchone() is not None
+            with self._cursor() as (conn, cursor):
+                if codes is None:
+                    cursor.execute("SELECT code FROM favorite_stocks")
+                else:
+                    placeholders = ', '.join(['%s'] * len(codes))
+                    cursor.execute(
+                        f"SELECT code FROM favorite_stocks WHERE code IN ({placeholders})",
+                        tuple(codes))
+                return {row[0] for row in cursor.fetchall()}
         except mysql.connector.Error as err:
             print(f"检查自选股票出错: {err}")
-            return False
-        finally:
-            cursor.close()
+            return set()
     
     # 历史数据相关操作
+    @timed_query
     def insert_history_data(self, code, df, frequency):
-        """插入股票历史数据"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor()
+        """插入股票历史数据（按 HISTORY_BATCH_SIZE 行分块写入，已存在的K线忽略）"""
+        query = """
+        INSERT IGNORE INTO stock_history 
+        (code, time, open, high, low, close, volume, amount, frequency)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
         try:
-            # 准备插入数据
-            data = []
-            for index, row in df.iterrows():
-                data.append((
-                    code,
-                    index,
-                    row.get('open'),
-                    row.get('high'),
-                    row.get('low'),
-                    row.get('close'),
-                    row.get('volume'),
-                    row.get('amount'),  # 新增成交额
-                    frequency
-                ))
-            
-            # 批量插入
-            query = """
-            INSERT IGNORE INTO stock_history 
-            (code, time, open, high, low, close, volume, amount, frequency)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.executemany(query, data)
-            self.connection.commit()
-            print(f"插入 {cursor.rowcount} 条数据到 {code} 的 {frequency} 历史记录")
+            inserted = self._write_chunks(query, frame_chunks(code, df, HISTORY_WRITE_COLUMNS, frequency,
+                                                              HISTORY_BATCH_SIZE), len(df))
+            print(f"插入 {inserted} 条数据到 {code} 的 {frequency} 历史记录")
         except mysql.connector.Error as err:
             print(f"插入历史数据出错: {err}")
-        finally:
-            cursor.close()
+    
+    def _write_chunks(self, query, chunks, total):
+        """在一个事务中逐块 executemany（改写为多行 INSERT），返回写入行数并输出写入速度"""
+        started = time.perf_counter()
+        inserted = 0
+        with self._cursor() as (conn, cursor):
+            for rows in chunks:
+                cursor.executemany(query, rows)
+                inserted += max(cursor.rowcount, 0)
+            conn.commit()
+        elapsed = time.perf_counter() - started
+        if total:
+            print(f"[{current_query_method()}] 写入 {total} 行，耗时 {elapsed:.3f}s"
+                  f"（{total / elapsed if elapsed else float('inf'):.0f} 行/秒）")
+        return inserted
     
     # 新增：获取股票历史数据方法
-    def get_stock_history(self, code, frequency, limit=100):
-        """从数据库获取股票历史数据"""
-        if not self.connection:
-            self.connect()
-            
-        cursor = self.connection.cursor(dictionary=True)
+    @timed_query
+    def get_stock_history(self, code, frequency, limit=100, as_frame=True):
+        """从数据库获取最近 limit 根K线（按时间升序）
+
+        as_frame 为 False 时返回 NumPy 列字典（见 rows_to_columns），不构造 DataFrame。
+        """
         try:
-            cursor.execute("""
-                SELECT time, open, high, low, close, volume, amount 
-                FROM stock_history 
-                WHERE code = %s AND frequency = %s
-                ORDER BY time DESC
-                LIMIT %s
-            """, (code, frequency, limit))
+            with self._cursor() as (conn, cursor):
+                # 时间直接取为自 1970-01-01 起的秒数（不受会话时区影响），避免逐行构造 datetime 再解析
+                cursor.execute(f"""
+                    SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', time), {', '.join(HISTORY_WRITE_COLUMNS)}
+                    FROM stock_history 
+                    WHERE code = %s AND frequency = %s
+                    ORDER BY time DESC
+                    LIMIT %s
+                """, (code, frequency, limit))
+                data = cursor.fetchall()
             
-            data = cursor.fetchall()
             if not data:
                 return None
-                
-            # 转换为DataFrame并按时间排序
-            df = pd.DataFrame(data)
-            df['time'] = pd.to_datetime(df['time'])
-            df = df.set_index('time')
-            df = df.sort_index()  # 按时间升序排列
-            
-            return df
+            return rows_to_columns(data, HISTORY_WRITE_COLUMNS, as_frame)
         except mysql.connector.Error as err:
             print(f"获取股票历史数据出错: {err}")
             return None
-        finally:
-            cursor.close()
+    
+    @timed_query
+    def get_latest_bars(self, codes, frequency='1d'):
+        """批量获取每只股票最新一根K线
+
+        一次查询返回 {code: (time, open, high, low, close, volume, amount)}，
+        没有历史数据的股票不在结果中。
+        """
+        codes = list(dict.fromkeys(codes))
+        if not codes:
+            return {}
+        placeholders = ', '.join(['%s'] * len(codes))
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(f"""
+                    SELECT h.code, h.time, h.open, h.high, h.low, h.close, h.volume, h.amount
+                    FROM stock_history h
+                    JOIN (
+                        SELECT code, MAX(time) AS time
+                        FROM stock_history
+                        WHERE frequency = %s AND code IN ({placeholders})
+                        GROUP BY code
+                    ) latest ON h.code = latest.code AND h.time = latest.time
+                    WHERE h.frequency = %s
+                """, (frequency, *codes, frequency))
+                return {row[0]: row[1:] for row in cursor.fetchall()}
+        except mysql.connector.Error as err:
+            print(f"批量获取最新K线出错: {err}")
+            return {}
+    
+    @timed_query
+    def get_latest_bar_time(self, code, frequency):
+        """数据库中某只股票某周期最后一根K线的时间，没有数据时返回 None"""
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(
+                    "SELECT MAX(time) FROM stock_history WHERE code = %s AND frequency = %s",
+                    (code, frequency))
+                return cursor.fetchone()[0]
+        except mysql.connector.Error as err:
+            print(f"获取最新K线时间出错: {err}")
+            return None
+    
+    @timed_query
+    def get_latest_indicator_time(self, code, frequency):
+        """stock_indicators 中某只股票某周期最后一条指标的时间，没有数据时返回 None"""
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(
+                    "SELECT MAX(time) FROM stock_indicators WHERE code = %s AND frequency = %s",
+                    (code, frequency))
+                return cursor.fetchone()[0]
+        except mysql.connector.Error as err:
+            print(f"获取最新指标时间出错: {err}")
+            return None
+    
+    @timed_query
+    def get_stock_kline(self, code, frequency, limit=100, as_frame=True):
+        """一次查询获取最近 limit 根K线及其技术指标（未计算过指标的K线，指标列为 NaN）"""
+        columns = (*HISTORY_WRITE_COLUMNS, *INDICATOR_WRITE_COLUMNS)
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(f"""
+                    SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', h.time),
+                           {', '.join(f'h.{name}' for name in HISTORY_WRITE_COLUMNS)},
+                           {', '.join(f'i.{name}' for name in INDICATOR_WRITE_COLUMNS)}
+                    FROM stock_history h
+                    LEFT JOIN stock_indicators i
+                        ON i.code = h.code AND i.time = h.time AND i.frequency = h.frequency
+                    WHERE h.code = %s AND h.frequency = %s
+                    ORDER BY h.time DESC
+                    LIMIT %s
+                """, (code, frequency, limit))
+                data = cursor.fetchall()
+            
+            if not data:
+                return None
+            return rows_to_columns(data, columns, as_frame)
+        except mysql.connector.Error as err:
+            print(f"获取K线及技术指标出错: {err}")
+            return None
+    
+    # 数据管道 stock_data 读取（代码为 ts_code，周期为 cycle，成交量列为 vol，只有日期没有时间）
+    def _pipeline_query(self, query, params):
+        """在 stock_data 上查询并返回全部行；表不存在时返回 None，且 PIPELINE_RETRY_INTERVAL 秒内不再查询"""
+        if time.monotonic() < self._pipeline_missing_until:
+            return None
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        except mysql.connector.Error as err:
+            if err.errno == errorcode.ER_NO_SUCH_TABLE:
+                self._pipeline_missing_until = time.monotonic() + PIPELINE_RETRY_INTERVAL
+                print("stock_data 表不存在，暂不从数据管道读取K线")
+            else:
+                print(f"读取数据管道K线出错: {err}")
+            return None
+    
+    @timed_query
+    def get_pipeline_history(self, code, frequency, limit=100, as_frame=True, with_indicators=False):
+        """从 stock_data 获取最近 limit 根K线，格式同 get_stock_history
+
+        with_indicators 为 True 时同时取出 src/Compute_indicators.py 按完整历史计算并写入
+        stock_indicators 的指标（格式同 get_stock_kline，没有指标的K线指标列为 NaN）。
+        周期不在 CYCLE_FREQUENCIES 中或数据管道没有该股票时返回 None。
+        """
+        cycle = FREQUENCY_CYCLES.get(frequency)
+        if cycle is None:
+            return None
+        columns = HISTORY_WRITE_COLUMNS
+        if with_indicators:
+            columns = (*HISTORY_WRITE_COLUMNS, *INDICATOR_WRITE_COLUMNS)
+            rows = self._pipeline_query(f"""
+                SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', d.trade_date),
+                       d.open, d.high, d.low, d.close, d.vol, d.amount,
+                       {', '.join(f'i.{name}' for name in INDICATOR_WRITE_COLUMNS)}
+                FROM stock_data d
+                LEFT JOIN stock_indicators i
+                    ON i.code = %s AND i.frequency = %s AND i.time = d.trade_date
+                WHERE d.ts_code = %s AND d.cycle = %s
+                ORDER BY d.trade_date DESC
+                LIMIT %s
+            """, (code, frequency, code_to_ts_code(code), cycle, limit))
+        else:
+            rows = self._pipeline_query("""
+                SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', trade_date), open, high, low, close, vol, amount
+                FROM stock_data
+                WHERE ts_code = %s AND cycle = %s
+                ORDER BY trade_date DESC
+                LIMIT %s
+            """, (code_to_ts_code(code), cycle, limit))
+        if not rows:
+            return None
+        return rows_to_columns(rows, columns, as_frame)
+    
+    @timed_query
+    def get_pipeline_latest_time(self, code, frequency):
+        """stock_data 中某只股票某周期最后一根K线的时间（datetime），没有数据时返回 None"""
+        cycle = FREQUENCY_CYCLES.get(frequency)
+        if cycle is None:
+            return None
+        rows = self._pipeline_query(
+            "SELECT MAX(trade_date) FROM stock_data WHERE ts_code = %s AND cycle = %s",
+            (code_to_ts_code(code), cycle))
+        if not rows or rows[0][0] is None:
+            return None
+        return datetime.combine(rows[0][0], datetime.min.time())
+    
+    @timed_query
+    def get_pipeline_latest_bars(self, codes):
+        """批量获取 stock_data 中每只股票最新一根日线，格式同 get_latest_bars"""
+        ts_codes = {code_to_ts_code(code): code for code in codes}
+        if not ts_codes:
+            return {}
+        placeholders = ', '.join(['%s'] * len(ts_codes))
+        rows = self._pipeline_query(f"""
+            SELECT d.ts_code, d.trade_date, d.open, d.high, d.low, d.close, d.vol, d.amount
+            FROM stock_data d
+            JOIN (
+                SELECT ts_code, MAX(trade_date) AS trade_date
+                FROM stock_data
+                WHERE cycle = %s AND ts_code IN ({placeholders})
+                GROUP BY ts_code
+            ) latest ON d.ts_code = latest.ts_code AND d.trade_date = latest.trade_date
+            WHERE d.cycle = %s
+        """, (FREQUENCY_CYCLES['1d'], *ts_codes, FREQUENCY_CYCLES['1d']))
+        return {ts_codes[row[0]]: (datetime.combine(row[1], datetime.min.time()), *row[2:])
+                for row in rows or ()}
     
     # 技术指标相关操作
+    @timed_query
     def insert_indicators(self, code, df, frequency):
-        if not self.connection:
-            self.connect()
-        cursor = self.connection.cursor()
+        """插入技术指标（NaN 写为 NULL，按 HISTORY_BATCH_SIZE 行分块写入）"""
+        query = """INSERT IGNORE INTO stock_indicators 
+                (code, time, ma5, ma10, ma20, ma60, macd, macd_diff, macd_dea,
+                rsi, kdj_k, kdj_d, kdj_j, frequency)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
         try:
-            data = []
-            for index, row in df.iterrows():
-                # 关键：将NaN替换为None（MySQL会识别为NULL）
-                def safe_null(value):
-                    return None if pd.isna(value) else value
-                
-                data.append((
-                    code,
-                    index,
-                    safe_null(row.get('ma5')),    # 处理NaN
-                    safe_null(row.get('ma10')),   # 处理NaN
-                    safe_null(row.get('ma20')),   # 处理NaN
-                    safe_null(row.get('ma60')),   # 处理NaN
-                    safe_null(row.get('macd')),   # 处理NaN
-                    safe_null(row.get('macd_diff')),
-                    safe_null(row.get('macd_dea')),
-                    safe_null(row.get('rsi')),
-                    safe_null(row.get('kdj_k')),
-                    safe_null(row.get('kdj_d')),
-                    safe_null(row.get('kdj_j')),
-                    frequency
-                ))
-            # 插入SQL（不变）
-            query = """INSERT IGNORE INTO stock_indicators 
-                    (code, time, ma5, ma10, ma20, ma60, macd, macd_diff, macd_dea,
-                    rsi, kdj_k, kdj_d, kdj_j, frequency)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
-            cursor.executemany(query, data)
-            self.connection.commit()
+            self._write_chunks(query, frame_chunks(code, df, INDICATOR_WRITE_COLUMNS, frequency,
+                                                   HISTORY_BATCH_SIZE), len(df))
         except Exception as err:
             print(f"插入技术指标出错: {err}")
-        finally:
-            cursor.close()
+
+    @timed_query
+    def delete_bars_since(self, code, frequency, since):
+        """删除某只股票某周期 since 及之后的K线和指标（重新写入尚未收盘、还在变化的K线前调用）"""
+        try:
+            with self._cursor() as (conn, cursor):
+                for table in ('stock_indicators', 'stock_history'):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE code = %s AND frequency = %s AND time >= %s",
+                        (code, frequency, since))
+                conn.commit()
+        except mysql.connector.Error as err:
+            print(f"删除K线出错: {err}")
+
+    @timed_query
+    def get_indicator_state(self, code, frequency):
+        """获取增量指标计算状态（IndicatorEngine.to_dict() 的结果），不存在时返回 None"""
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(
+                    "SELECT state FROM indicator_state WHERE code = %s AND frequency = %s",
+                    (code, frequency))
+                row = cursor.fetchone()
+            return json.loads(row[0]) if row else None
+        except mysql.connector.Error as err:
+            print(f"获取指标计算状态出错: {err}")
+            return None
+    
+    @timed_query
+    def save_indicator_state(self, code, frequency, state):
+        """保存增量指标计算状态"""
+        try:
+            query = """
+            INSERT INTO indicator_state (code, frequency, last_time, state, updated_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            last_time = VALUES(last_time),
+            state = VALUES(state),
+            updated_at = VALUES(updated_at)
+            """
+            with self._cursor() as (conn, cursor):
+                cursor.execute(query, (code, frequency, state.get('last_time'),
+                                       json.dumps(state), datetime.now()))
+                conn.commit()
+        except mysql.connector.Error as err:
+            print(f"保存指标计算状态出错: {err}")
     
     def close(self):
-        """关闭数据库连接"""
-        if self.connection:
-            self.connection.close()
+        """关闭连接池中的全部连接"""
+        if self.pool:
+            self.pool.close()
             print("数据库连接已关闭")
@@ -0,0 +1,85 @@
+"""
+页面缓存校验与响应压缩
+
+conditional_page() 根据数据版本（最新K线时间、stock_list.last_updated 等）生成 ETag /
+Last-Modified，浏览器带着相同的校验值再次请求时直接返回 304，不再渲染页面；
+init_compression() 对 HTML / JSON / 二进制K线响应按 Accept-Encoding 做 brotli 或 gzip 压缩。
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+
+from flask import make_response, request
+
+from config import COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+from metrics import record_cache
+from serialization import BINARY_MIMETYPE
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json', BINARY_MIMETYPE)
+
+
+def _http_time(value):
+    """数据库中的本地时间（不带时区，按服务器时区解释）转为秒级精度的 UTC 时间
+
+    不晚于当前时间：Last-Modified 不能晚于响应的 Date，而周线、月线等K线的时间为周期结束日，可能在未来。
+    """
+    if value is None:
+        return None
+    value = value.astimezone(timezone.utc) if value.tzinfo is None else value
+    return min(value, datetime.now(timezone.utc)).replace(microsecond=0)
+
+
+def conditional_page(version, last_modified, render):
+    """带缓存校验的页面响应
+
+    version: 决定页面内容的数据版本（可 repr 的值），与请求路径和参数一起生成 ETag；
+    last_modified: 页面数据的最近更新时间，可为 None；
+    render: 无参函数，返回页面内容或响应（可为 (内容, 状态码)），只在需要重新生成页面时调用；
+    渲染失败时应返回非 200 状态码，这样的响应不带 ETag / Last-Modified。
+    """
+    etag = hashlib.sha1(repr((request.full_path, version)).encode('utf-8')).hexdigest()
+    last_modified = _http_time(last_modified)
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = (last_modified is not None and request.if_modified_since is not None
+                 and request.if_modified_since >= last_modified)
+    record_cache('page', fresh)
+    response = make_response('', 304) if fresh else make_response(render())
+    if response.status_code in (200, 304):
+        # 压缩后的内容字节不同，使用弱校验值
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_compression(app):
+    """注册响应压缩"""
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            response.set_data(brotli.compress(data, quality=COMPRESS_LEVEL))
+            response.headers['Content-Encoding'] = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
@@ -0,0 +1,218 @@
+"""
+增量技术指标计算
+
+IndicatorEngine 保存计算下一根K线指标所需的全部状态（EMA 值、均线/RSI/KDJ
+的滚动窗口），每追加一根K线只需 O(窗口长度) 的计算，结果与
+Ashare.calculate_indicators 对同一完整序列的批量计算一致。
+状态可通过 to_dict()/from_dict() 序列化，按 (code, frequency) 保存到数据库。
+"""
+import json
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from Ashare import INDICATOR_COLUMNS
+
+MA_WINDOWS = (5, 10, 20, 60)
+RSI_WINDOW = 14
+KDJ_WINDOW = 9
+KDJ_D_WINDOW = 3
+EMA_FAST, EMA_SLOW, EMA_SIGNAL = 12, 26, 9
+
+
+def _alpha(span):
+    return 2.0 / (span + 1)
+
+
+def _divide(numerator, denominator):
+    """与 pandas 一致的除法：除以0得到 ±inf，0/0 得到 NaN"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(numerator) / np.float64(denominator))
+
+
+class IndicatorEngine:
+    """单只股票、单一周期的增量指标计算器"""
+
+    def __init__(self):
+        self.last_time = None
+        self.prev_close = None
+        self.ema_fast = None
+        self.ema_slow = None
+        self.signal = None
+        self.closes = deque(maxlen=max(MA_WINDOWS))
+        self.gains = deque(maxlen=RSI_WINDOW)
+        self.losses = deque(maxlen=RSI_WINDOW)
+        self.highs = deque(maxlen=KDJ_WINDOW)
+        self.lows = deque(maxlen=KDJ_WINDOW)
+        self.ks = deque(maxlen=KDJ_D_WINDOW)
+
+    def _step(self, close, high, low):
+        """追加一根K线，返回该K线的指标值（顺序同 INDICATOR_COLUMNS）"""
+        nan = float('nan')
+
+        # 均线
+        self.closes.append(close)
+        closes = list(self.closes)
+        mas = [math.fsum(closes[-n:]) / n if len(closes) >= n else nan for n in MA_WINDOWS]
+
+        # MACD（ewm adjust=False，首个值为第一根收盘价）
+        if self.ema_fast is None:
+            self.ema_fast = self.ema_slow = close
+        else:
+            self.ema_fast += _alpha(EMA_FAST) * (close - self.ema_fast)
+            self.ema_slow += _alpha(EMA_SLOW) * (close - self.ema_slow)
+        macd = self.ema_fast - self.ema_slow
+        if self.signal is None:
+            self.signal = macd
+        else:
+            self.signal += _alpha(EMA_SIGNAL) * (macd - self.signal)
+        macd_diff = self.signal
+        macd_dea = macd - macd_diff
+
+        # RSI（第一根K线的涨跌记为0，与 diff().where(...) 的结果一致）
+        change = 0.0 if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+        self.gains.append(change if change > 0 else 0.0)
+        self.losses.append(-change if change < 0 else 0.0)
+        rsi = nan
+        if len(self.gains) == RSI_WINDOW:
+            rs = _divide(math.fsum(self.gains) / RSI_WINDOW, math.fsum(self.losses) / RSI_WINDOW)
+            rsi = 100 - _divide(100, 1 + rs)
+
+        # KDJ
+        self.highs.append(high)
+        self.lows.append(low)
+        kdj_k = nan
+        if len(self.lows) == KDJ_WINDOW:
+            low_min = min(self.lows)
+            kdj_k = 100 * _divide(close - low_min, max(self.highs) - low_min)
+        self.ks.append(kdj_k)
+        kdj_d = nan
+        # 与 pandas rolling().mean() 一致：窗口内有 NaN 或 ±inf 时结果为 NaN
+        if len(self.ks) == KDJ_D_WINDOW and all(math.isfinite(k) for k in self.ks):
+            kdj_d = sum(self.ks) / KDJ_D_WINDOW
+        kdj_j = 3 * kdj_k - 2 * kdj_d
+
+        return (*mas, macd, macd_diff, macd_dea, rsi, kdj_k, kdj_d, kdj_j)
+
+    def update(self, df):
+        """追加 df 中晚于 last_time 的K线（需含 close/high/low 列），返回这些K线的指标 DataFrame"""
+        if self.last_time is not None:
+            df = df[df.index > self.last_time]
+        rows = [self._step(float(close), float(high), float(low))
+                for close, high, low in zip(df['close'], df['high'], df['low'])]
+        if len(df):
+            self.last_time = df.index[-1]
+        return pd.DataFrame(rows, index=df.index, columns=INDICATOR_COLUMNS, dtype=float)
+
+    def to_dict(self):
+        """导出状态，可 JSON 序列化"""
+        return {
+            'last_time': self.last_time.isoformat() if self.last_time is not None else None,
+            'prev_close': self.prev_close,
+            'ema_fast': self.ema_fast,
+            'ema_slow': self.ema_slow,
+            'signal': self.signal,
+            'closes': list(self.closes),
+            'gains': list(self.gains),
+            'losses': list(self.losses),
+            'highs': list(self.highs),
+            'lows': list(self.lows),
+            'ks': list(self.ks),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """从 to_dict() 导出的状态恢复"""
+        engine = cls()
+        if state.get('last_time'):
+            engine.last_time = pd.Timestamp(state['last_time'])
+        engine.prev_close = state.get('prev_close')
+        engine.ema_fast = state.get('ema_fast')
+        engine.ema_slow = state.get('ema_slow')
+        engine.signal = state.get('signal')
+        for name in ('closes', 'gains', 'losses', 'highs', 'lows', 'ks'):
+            getattr(engine, name).extend(state.get(name, []))
+        return engine
+
+    def dumps(self):
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+def panel_indicators(close, high, low):
+    """对二维价格矩阵（行为K线，列为股票）一次性计算全部指标
+
+    close/high/low 为形状相同的 DataFrame，返回 {指标名: 同形状 DataFrame}。
+    每列应为一只股票连续的K线，列首可以用 NaN 补齐（不同股票上市时间不同）；
+    结果与对每列单独调用 Ashare.calculate_indicators 相同。
+    """
+    result = {f'ma{n}': close.rolling(window=n).mean() for n in MA_WINDOWS}
+
+    ema_fast = close.ewm(span=EMA_FAST, adjust=False).mean()
+    ema_slow = close.ewm(span=EMA_SLOW, adjust=False).mean()
+    result['macd'] = ema_fast - ema_slow
+    result['macd_diff'] = result['macd'].ewm(span=EMA_SIGNAL, adjust=False).mean()
+    result['macd_dea'] = result['macd'] - result['macd_diff']
+
+    # 补齐的 NaN 行不计入 RSI 窗口；每只股票第一根K线的涨跌记为0
+    valid = close.notna()
+    delta = close.diff(1)
+    gain = delta.where(delta > 0, 0).where(valid)
+    loss = (-delta.where(delta < 0, 0)).where(valid)
+    rs = gain.rolling(window=RSI_WINDOW).mean() / loss.rolling(window=RSI_WINDOW).mean()
+    result['rsi'] = 100 - (100 / (1 + rs))
+
+    low_min = low.rolling(window=KDJ_WINDOW).min()
+    high_max = high.rolling(window=KDJ_WINDOW).max()
+    result['kdj_k'] = 100 * ((close - low_min) / (high_max - low_min))
+    result['kdj_d'] = result['kdj_k'].rolling(window=KDJ_D_WINDOW).mean()
+    result['kdj_j'] = 3 * result['kdj_k'] - 2 * result['kdj_d']
+    return result
+
+
+def calculate_panel_indicators(data, code_col='ts_code', time_col='trade_date', chunk_size=500):
+    """全市场指标计算：输入长表（每行一只股票一根K线，如 stock_data 的 ts_code × trade_date），
+    返回与输入行一一对应的长表 [code_col, time_col, *INDICATOR_COLUMNS]
+
+    每只股票的K线按时间右对齐放入二维矩阵后调用 panel_indicators，
+    停牌等缺口不会在矩阵中留下空行；每次处理 chunk_size 只股票以控制内存。
+    多周期数据（含 cycle 列）应按周期分别调用。
+    """
+    data = data.sort_values([code_col, time_col], kind='stable').reset_index(drop=True)
+    codes = data[code_col].to_numpy()
+    # 每只股票在排序后长表中的起止位置
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(codes)]
+
+    prices = {name: data[name].to_numpy(dtype=float) for name in ('close', 'high', 'low')}
+    output = np.full((len(data), len(INDICATOR_COLUMNS)), np.nan)
+
+    for chunk in range(0, len(starts), chunk_size):
+        chunk_starts, chunk_ends = starts[chunk:chunk + chunk_size], ends[chunk:chunk + chunk_size]
+        lengths = chunk_ends - chunk_starts
+        rows_total = int(lengths.max())
+        # 长表行 -> (矩阵行, 矩阵列)：每只股票最后一根K线落在矩阵最后一行
+        column = np.repeat(np.arange(len(lengths)), lengths)
+        offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        row = np.repeat(rows_total - lengths, lengths) + offset
+        source = np.arange(chunk_starts[0], chunk_ends[-1])
+
+        matrices = {}
+        for name, values in prices.items():
+            matrix = np.full((rows_total, len(lengths)), np.nan)
+            matrix[row, column] = values[source]
+            matrices[name] = pd.DataFrame(matrix)
+        result = panel_indicators(matrices['close'], matrices['high'], matrices['low'])
+        for i, name in enumerate(INDICATOR_COLUMNS):
+            output[source, i] = result[name].to_numpy()[row, column]
+
+    frame = pd.DataFrame(output, columns=INDICATOR_COLUMNS)
+    frame.insert(0, time_col, data[time_col].to_numpy())
+    frame.insert(0, code_col, codes)
+    return frame
@@ -0,0 +1,204 @@
+"""
+运行指标采集，以 Prometheus 文本格式从 /metrics 输出
+
+- http_request_duration_seconds：按路由、方法、状态码统计的请求耗时直方图
+- db_query_duration_seconds / db_query_rows_total：StockDatabase 各方法的查询耗时与行数
+- upstream_request_duration_seconds：行情接口（get_price）调用耗时
+- cache_requests_total：各缓存的命中（hit）与未命中（miss）次数
+"""
+import functools
+import threading
+import time
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """按标签累加的计数器"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """按标签统计的耗时直方图"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [各桶计数..., 总和, 次数]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[-1] if state else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            for bound, count in zip(self.buckets, state):
+                le = (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}')
+            le = (('le', '+Inf'),)
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP 请求耗时（秒）',
+                             ('route', 'method', 'status'))
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'StockDatabase 方法的查询耗时（秒）', ('method',))
+DB_QUERY_ROWS = Counter('db_query_rows_total', 'StockDatabase 方法返回或影响的行数', ('method',))
+DB_QUERY_ERRORS = Counter('db_query_errors_total', 'StockDatabase 方法中的 SQL 错误次数', ('method',))
+UPSTREAM_DURATION = Histogram('upstream_request_duration_seconds', '行情接口调用耗时（秒）',
+                              ('function', 'frequency'))
+CACHE_REQUESTS = Counter('cache_requests_total', '缓存读取次数（result=hit/miss）', ('cache', 'result'))
+
+REGISTRY = [REQUEST_DURATION, DB_QUERY_DURATION, DB_QUERY_ROWS, DB_QUERY_ERRORS, UPSTREAM_DURATION, CACHE_REQUESTS]
+
+# 当前线程正在计时的数据库方法：[[方法名, 行数], ...]
+_query_stack = threading.local()
+
+
+def timed_query(method):
+    """装饰 StockDatabase 中执行 SQL 的方法，记录耗时与行数"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_query_stack, 'stack', None)
+        if stack is None:
+            stack = _query_stack.stack = []
+        stack.append([name, 0])
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.observe(time.perf_counter() - started, name)
+            rows = stack.pop()[1]
+            DB_QUERY_ROWS.inc(name, amount=rows)
+
+    return wrapper
+
+
+def record_rows(rows):
+    """累加当前数据库方法的行数（由 StockDatabase._cursor 在语句执行后调用）"""
+    stack = getattr(_query_stack, 'stack', None)
+    if stack and rows and rows > 0:
+        stack[-1][1] += rows
+
+
+def current_query_method():
+    """当前线程正在执行的 StockDatabase 方法名"""
+    stack = getattr(_query_stack, 'stack', None)
+    return stack[-1][0] if stack else None
+
+
+def record_query_error():
+    """记录当前数据库方法中的 SQL 错误（方法内部捕获的错误也会计入）"""
+    stack = getattr(_query_stack, 'stack', None)
+    DB_QUERY_ERRORS.inc(stack[-1][0] if stack else 'unknown')
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def timed_upstream(function):
+    """装饰行情接口函数，按周期记录调用耗时"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            UPSTREAM_DURATION.observe(time.perf_counter() - started, function.__name__,
+                                      kwargs.get('frequency', ''))
+
+    return wrapper
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """注册请求计时钩子和 /metrics 接口"""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    def observe(status):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_DURATION.observe(time.perf_counter() - started, route, request.method, str(status))
+
+    @app.after_request
+    def record_request(response):
+        observe(response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(error):
+        # 未处理的异常不会经过 after_request
+        if error is not None:
+            observe(500)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
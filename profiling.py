@@ -0,0 +1,131 @@
+"""
+单请求性能分析
+
+按需对单个请求运行 cProfile（cpu）和/或 tracemalloc（memory），结果写入 PROFILE_DIR：
+- cpu：<时间>_<路由>.prof（可用 pstats / snakeviz 打开）及按累计耗时排序的前 40 项 .cpu.txt
+- memory：<时间>_<路由>.memory.txt，请求期间按代码行统计的内存增长及峰值
+
+开启方式：环境变量 PROFILE_MODE=cpu|memory|all 分析每个请求；
+或设置 PROFILE_HEADER=1 后，在单个请求上带请求头 X-Profile: cpu|memory|all。
+响应头 X-Profile-Output 返回生成的文件名。
+注意 tracemalloc 统计整个进程，并发请求的内存分配会计入同一份结果。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+
+from flask import g, request
+
+from config import PROFILE_DIR, PROFILE_HEADER, PROFILE_MODE
+
+PROFILE_MODES = {'cpu': ('cpu',), 'memory': ('memory',), 'all': ('cpu', 'memory')}
+TOP_STATS = 40
+# 内存统计中排除分析工具自身的分配
+TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__),
+                 tracemalloc.Filter(False, cProfile.__file__),
+                 tracemalloc.Filter(False, pstats.__file__)]
+
+# 正在进行内存分析的请求数，最后一个结束时停止 tracemalloc
+_tracing_lock = threading.Lock()
+_tracing_requests = 0
+_tracing_started = False
+
+
+def _requested_modes():
+    mode = PROFILE_MODE
+    if PROFILE_HEADER and request.headers.get('X-Profile'):
+        mode = request.headers['X-Profile']
+    return PROFILE_MODES.get(mode.strip().lower(), ()) if mode else ()
+
+
+def _start_tracing():
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        if _tracing_requests == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            _tracing_started = True
+        _tracing_requests += 1
+        tracemalloc.reset_peak()
+        return tracemalloc.take_snapshot()
+
+
+def _stop_tracing():
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_requests -= 1
+        if _tracing_requests == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+        return snapshot, peak
+
+
+def _output_path(suffix):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+    return os.path.join(PROFILE_DIR, f"{g.profile_stamp}_{endpoint}{suffix}")
+
+
+def init_profiling(app):
+    """注册请求性能分析钩子"""
+
+    @app.before_request
+    def start_profiling():
+        modes = _requested_modes()
+        if not modes:
+            return
+        g.profile_stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        if 'memory' in modes:
+            g.memory_before = _start_tracing()
+        if 'cpu' in modes:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def stop_profiling(response):
+        outputs = []
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        # 先取内存快照，避免把写出分析结果的分配计入请求
+        before = g.pop('memory_before', None)
+        if before is not None:
+            after, peak = _stop_tracing()
+            stats = after.filter_traces(TRACE_FILTERS).compare_to(before.filter_traces(TRACE_FILTERS), 'lineno')
+
+        if profiler is not None:
+            path = _output_path('.prof')
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(TOP_STATS)
+            with open(_output_path('.cpu.txt'), 'w', encoding='utf-8') as f:
+                f.write(f"{request.method} {request.full_path}\n{summary.getvalue()}")
+            outputs.append(os.path.basename(path))
+
+        if before is not None:
+            path = _output_path('.memory.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"{request.method} {request.full_path}\n峰值内存: {peak / 1024:.1f} KiB\n")
+                f.write(f"内存增长最多的前 {TOP_STATS} 行:\n")
+                for stat in stats[:TOP_STATS]:
+                    f.write(f"{stat}\n")
+            outputs.append(os.path.basename(path))
+
+        if outputs:
+            print(f"请求性能分析 {request.method} {request.full_path}: {', '.join(outputs)}")
+            response.headers['X-Profile-Output'] = ', '.join(outputs)
+        return response
+
+    @app.teardown_request
+    def abort_profiling(error):
+        # 未处理的异常不会经过 after_request，这里只做清理
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        if g.pop('memory_before', None) is not None:
+            _stop_tracing()
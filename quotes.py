@@ -0,0 +1,153 @@
+"""
+实时行情轮询与推送
+
+QuotePoller 在后台线程中按固定间隔刷新“正在被观看”的股票行情：
+每只股票每个周期只请求一次上游接口，再把变化的行情分发给所有订阅该股票的客户端
+（/api/quotes/stream 以 Server-Sent Events 推送），上游请求量与不同股票数成正比，
+与打开页面的浏览器数量无关。没有订阅者的股票会在下一个周期停止刷新。
+"""
+import json
+import queue
+import threading
+import time
+
+from upstream import fetch_price
+from config import QUOTE_POLL_INTERVAL, QUOTE_SUBSCRIBER_BUFFER
+from metrics import record_cache
+
+
+def fetch_quote(code):
+    """从接口获取一只股票的最新行情"""
+    df, _ = fetch_price(code, count=1, frequency='1d')
+    bar = df.iloc[-1]
+    quote = {
+        'code': code,
+        'price': round(float(bar['close']), 2),
+        'open': round(float(bar['open']), 2),
+        'high': round(float(bar['high']), 2),
+        'low': round(float(bar['low']), 2),
+        'volume': int(bar['volume']),
+        'time': df.index[-1].strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    # 计算涨跌幅
+    quote['change'] = round((quote['price'] - quote['open']) / quote['open'] * 100, 2)
+    return quote
+
+
+class QuotePoller:
+    """按股票代码共享的行情轮询器"""
+
+    def __init__(self, fetch=fetch_quote, interval=QUOTE_POLL_INTERVAL,
+                 buffer_size=QUOTE_SUBSCRIBER_BUFFER):
+        self.fetch = fetch
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers = {}  # code -> set(Queue)
+        self._quotes = {}  # code -> (行情, 获取时间)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get(self, code):
+        """返回最新行情：一个轮询周期内获取过的直接复用，否则立即请求一次"""
+        with self._lock:
+            cached = self._quotes.get(code)
+        fresh = cached is not None and time.monotonic() - cached[1] < self.interval
+        record_cache('quote', fresh)
+        if fresh:
+            return cached[0]
+        quote = self.fetch(code)
+        with self._lock:
+            # 轮询线程只在有订阅者时运行，单独请求过的股票也在这里清理
+            self._evict_stale()
+            self._quotes[code] = (quote, time.monotonic())
+        return quote
+
+    def _evict_stale(self):
+        """删除没有订阅者且已超过一个轮询周期的行情（需持有 _lock）"""
+        expired = time.monotonic() - self.interval
+        for code in [code for code, (_, fetched_at) in self._quotes.items()
+                     if fetched_at < expired and code not in self._subscribers]:
+            del self._quotes[code]
+
+    def subscribe(self, code):
+        """订阅一只股票的行情更新，返回接收行情的队列"""
+        subscriber = queue.Queue(maxsize=self.buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(code, set()).add(subscriber)
+            cached = self._quotes.get(code)
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+                self._thread.start()
+        # 先推送已有的行情，客户端无需等待下一个周期
+        if cached is not None:
+            subscriber.put_nowait(cached[0])
+        return subscriber
+
+    def unsubscribe(self, code, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(code)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[code]
+
+    def watched_codes(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def poll_once(self):
+        """刷新所有被订阅股票的行情，并把有变化的行情分发给订阅者；清理不再被订阅的股票的行情"""
+        with self._lock:
+            self._evict_stale()
+        for code in self.watched_codes():
+            try:
+                quote = self.fetch(code)
+            except Exception as e:
+                print(f"获取实时行情失败 {code}: {e}")
+                continue
+            with self._lock:
+                previous = self._quotes.get(code)
+                self._quotes[code] = (quote, time.monotonic())
+                subscribers = list(self._subscribers.get(code, ()))
+            if previous is not None and previous[0] == quote:
+                continue
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(quote)
+                except queue.Full:
+                    # 客户端消费过慢时丢弃最旧的行情，只保留最新的
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+                    subscriber.put_nowait(quote)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            with self._lock:
+                if not self._subscribers:
+                    # 没有订阅者时退出，下次订阅再启动
+                    self._thread = None
+                    return
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stop(self):
+        self._stop.set()
+
+    def stream(self, code, heartbeat=15):
+        """SSE 事件流生成器：推送行情，空闲时发送注释行保持连接"""
+        subscriber = self.subscribe(code)
+        try:
+            while True:
+                try:
+                    quote = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"data: {json.dumps(quote, ensure_ascii=False)}\n\n"
+        finally:
+            self.unsubscribe(code, subscriber)
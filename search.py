@@ -0,0 +1,119 @@
+"""
+股票搜索索引
+
+StockSearchIndex 对 stock_list 建立内存索引，支持三种匹配：
+代码前缀（sh600519 或 600519）、拼音首字母前缀（gzmt → 贵州茅台）、名称子串。
+前缀匹配在排序后的键上二分查找，名称子串在拼接后的名称串上用 str.find 查找，
+全市场数千只股票单次查询在 1ms 内完成。
+拼音首字母依赖可选的 pypinyin，未安装时只支持代码和名称搜索。
+"""
+import threading
+from bisect import bisect_left, bisect_right
+
+# pypinyin 为可选依赖，导入较慢，第一次建立索引时再导入
+_pinyin = None
+
+SEARCH_FIELDS = ('code', 'name', 'market', 'industry', 'pe', 'pb', 'total_market_cap')
+
+# 匹配类型的排序优先级：代码完全匹配 > 代码前缀 > 拼音首字母前缀 > 名称子串
+RANK_EXACT, RANK_CODE, RANK_INITIALS, RANK_NAME = range(4)
+
+
+def name_initials(name):
+    """股票名称的拼音首字母（小写），非汉字字符原样保留"""
+    global _pinyin
+    if _pinyin is None:
+        try:
+            import pypinyin
+            _pinyin = pypinyin
+        except ImportError:
+            _pinyin = False
+    if not _pinyin or not name:
+        return ''
+    initials = _pinyin.lazy_pinyin(name, style=_pinyin.Style.FIRST_LETTER, errors='default')
+    return ''.join(initials).lower().replace(' ', '')
+
+
+def _prefix_range(keys, prefix, limit):
+    """排序键列表中以 prefix 开头的前 limit 项（按键排序，完全匹配在最前）"""
+    start = bisect_left(keys, (prefix,))
+    end = min(bisect_right(keys, (prefix + '\uffff',)), start + limit)
+    return keys[start:end]
+
+
+class StockSearchIndex:
+    """基于一份股票列表构建的只读索引"""
+
+    def __init__(self, stocks):
+        self.stocks = [{field: stock.get(field) for field in SEARCH_FIELDS} for stock in stocks]
+        code_keys, initial_keys = [], []
+        for i, stock in enumerate(self.stocks):
+            code = (stock['code'] or '').lower()
+            code_keys.append((code, i))
+            # 不带市场前缀的数字代码
+            digits = code.lstrip('abcdefghijklmnopqrstuvwxyz')
+            if digits and digits != code:
+                code_keys.append((digits, i))
+            initials = name_initials(stock['name'])
+            if initials:
+                initial_keys.append((initials, i))
+        self.code_keys = sorted(code_keys)
+        self.initial_keys = sorted(initial_keys)
+
+        # 名称以换行拼接，offsets[i] 为第 i 只股票名称的起始位置
+        names = [(stock['name'] or '').lower().replace('\n', ' ') for stock in self.stocks]
+        self.name_blob = '\n'.join(names)
+        self.offsets = []
+        position = 0
+        for name in names:
+            self.offsets.append(position)
+            position += len(name) + 1
+
+    def search(self, query, limit=10):
+        """返回最多 limit 只匹配的股票，按匹配类型排序，同类按匹配键排序"""
+        query = (query or '').strip().lower()
+        if not query or limit <= 0:
+            return []
+        ranks = {}  # 股票序号 -> (匹配类型, 命中顺序)
+
+        # 同一只股票可能以带前缀代码和数字代码各命中一次，保留更优的匹配
+        for key, i in _prefix_range(self.code_keys, query, 2 * limit):
+            rank = (RANK_EXACT if key == query else RANK_CODE, len(ranks))
+            ranks[i] = min(rank, ranks.get(i, rank))
+        for _, i in _prefix_range(self.initial_keys, query, limit):
+            ranks.setdefault(i, (RANK_INITIALS, len(ranks)))
+
+        # 名称子串：已有足够的更优匹配时不再扫描
+        if len(ranks) < limit and '\n' not in query:
+            position = self.name_blob.find(query)
+            while position != -1 and len(ranks) < limit:
+                i = bisect_right(self.offsets, position) - 1
+                ranks.setdefault(i, (RANK_NAME, len(ranks)))
+                # 跳到下一只股票的名称，避免同一名称重复命中
+                next_start = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.name_blob)
+                position = self.name_blob.find(query, next_start)
+
+        ordered = sorted(ranks, key=ranks.get)
+        return [self.stocks[i] for i in ordered[:limit]]
+
+
+class StockSearch:
+    """跟随 StockListCache 快照自动重建的搜索索引"""
+
+    def __init__(self, stock_cache):
+        self.stock_cache = stock_cache
+        self._lock = threading.Lock()
+        self._source = None
+        self._index = StockSearchIndex([])
+
+    def index(self):
+        stocks = self.stock_cache.stocks
+        if stocks is not self._source:
+            with self._lock:
+                if stocks is not self._source:
+                    self._index = StockSearchIndex(stocks)
+                    self._source = stocks
+        return self._index
+
+    def search(self, query, limit=10):
+        return self.index().search(query, limit)
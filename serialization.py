@@ -0,0 +1,119 @@
+"""
+K线 / 历史数据 DataFrame 到接口数据的序列化
+
+按列整体处理：每列转为 NumPy 数组后一次性四舍五入，NaN 统一转为 None，
+再输出为列式 {字段: [值, ...]} 或按行的 [{字段: 值, ...}, ...]，
+避免 iterrows 与逐单元格 pd.isna 判断；frame_binary 输出小端浮点数组的二进制列式格式，
+前端可直接作为 TypedArray 使用。
+长区间K线可先用 downsample_bars 按图表宽度合并，使数据量与K线总数无关。
+"""
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 字段及保留小数位数（None 表示取整）
+HISTORY_COLUMNS = {
+    'open': 2, 'high': 2, 'low': 2, 'close': 2, 'volume': None, 'amount': 2,
+}
+
+KLINE_COLUMNS = {
+    **HISTORY_COLUMNS,
+    'ma5': 2, 'ma10': 2, 'ma20': 2, 'ma60': 2,
+    'macd': 4, 'macd_diff': 4, 'macd_dea': 4,
+    'rsi': 2, 'kdj_k': 2, 'kdj_d': 2, 'kdj_j': 2,
+}
+
+
+def column_values(values, digits):
+    """将一列数值四舍五入并转为 Python 列表，NaN 转为 None；digits 为 None 时取整"""
+    import numpy as np
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    if digits is None:
+        result = np.where(missing, 0, np.round(values)).astype(np.int64).tolist()
+    else:
+        result = np.round(values, digits).tolist()
+    for i in np.flatnonzero(missing).tolist():
+        result[i] = None
+    return result
+
+
+def frame_columns(df, columns=KLINE_COLUMNS):
+    """列式输出：{'time': [...], 'open': [...], ...}，DataFrame 中不存在的字段跳过"""
+    payload = {'time': df.index.strftime(TIME_FORMAT).tolist()}
+    for name, digits in columns.items():
+        if name in df.columns:
+            payload[name] = column_values(df[name].to_numpy(), digits)
+    return payload
+
+
+def frame_records(df, columns=KLINE_COLUMNS):
+    """按行输出：[{'time': ..., 'open': ..., ...}, ...]，DataFrame 中不存在的字段为 None"""
+    payload = frame_columns(df, columns)
+    names = ['time', *columns]
+    values = [payload.get(name) or [None] * len(df) for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+# 二进制列式格式（/api/kline 通过 Accept 协商）：
+#   4 字节魔数 b'SCOL' + uint32 小端头部长度 + UTF-8 JSON 头部，
+#   之后的数据区中每列为 count 个小端浮点数，起始位置按 8 字节对齐，缺失值为 NaN。
+#   头部: {"count": n, "columns": [{"name": ..., "type": "f8" | "f4", "offset": 数据区内偏移}], ...附加字段}
+#   time 列为 float64 秒数（数据库中的本地时间按 UTC 解释，前端按 UTC 取日期即为原时间）。
+BINARY_MIMETYPE = 'application/vnd.stock.columns'
+BINARY_MAGIC = b'SCOL'
+
+
+def frame_binary(df, columns=KLINE_COLUMNS, meta=None):
+    """二进制列式输出：保留小数的价格和指标为 float32，时间、成交量和成交额为 float64"""
+    import json
+    import numpy as np
+
+    arrays = [('time', 'f8', df.index.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9)]
+    for name, digits in columns.items():
+        if name in df.columns:
+            values = np.round(df[name].to_numpy(dtype=float), digits or 0)
+            # float32 只有约7位有效数字，成交量、成交额等大数用 float64
+            arrays.append((name, 'f4' if digits is not None and name != 'amount' else 'f8', values))
+
+    layout, offset = [], 0
+    for name, kind, _ in arrays:
+        layout.append({'name': name, 'type': kind, 'offset': offset})
+        offset += (len(df) * int(kind[1]) + 7) // 8 * 8
+    header = {'count': len(df), 'columns': layout, **(meta or {})}
+
+    # 头部补空格使数据区从 8 字节对齐的位置开始
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header_bytes)) % 8)
+    start = len(BINARY_MAGIC) + 4 + len(header_bytes)
+    buffer = bytearray(start + offset)
+    buffer[:start] = BINARY_MAGIC + len(header_bytes).to_bytes(4, 'little') + header_bytes
+    for column, (_, kind, values) in zip(layout, arrays):
+        data = values.astype('<' + kind).tobytes()
+        position = start + column['offset']
+        buffer[position:position + len(data)] = data
+    return bytes(buffer)
+
+
+def downsample_bars(df, buckets):
+    """把K线按时间顺序均匀合并为 buckets 根（不足时原样返回）
+
+    每组的 open 取第一根、high/low 取最大/最小、close 取最后一根，volume/amount 求和；
+    时间和技术指标取组内最后一根K线的值，即指标仍按完整分辨率的序列计算，合并时只做采样。
+    """
+    count = len(df)
+    if buckets <= 0 or count <= buckets:
+        return df
+    import numpy as np
+
+    starts = np.linspace(0, count, buckets + 1).astype(np.int64)[:-1]
+    ends = np.r_[starts[1:], count]
+    result = df.iloc[ends - 1].copy()
+    if 'open' in df.columns:
+        result['open'] = df['open'].to_numpy()[starts]
+    if 'high' in df.columns:
+        result['high'] = np.fmax.reduceat(df['high'].to_numpy(dtype=float), starts)
+    if 'low' in df.columns:
+        result['low'] = np.fmin.reduceat(df['low'].to_numpy(dtype=float), starts)
+    for name in ('volume', 'amount'):
+        if name in df.columns:
+            result[name] = np.add.reduceat(np.nan_to_num(df[name].to_numpy(dtype=float)), starts)
+    return result
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import logging
+
+import pandas as pd
+import pymysql
+
+from Upload_mysql import create_database_connection
+
+# 复用项目根目录下的指标计算和代码转换
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators import calculate_panel_indicators
+from Ashare import INDICATOR_COLUMNS
+from db_operations import CYCLE_FREQUENCIES, ts_code_to_code
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50000
+# 每次读取并计算的股票数：指标需要完整历史，按股票分组读取以控制内存
+CODE_CHUNK_SIZE = 500
+LOAD_COLUMNS = ['ts_code', 'trade_date', 'high', 'low', 'close']
+
+
+def load_codes(conn, cycle):
+    """某一周期有K线的全部股票代码"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT ts_code FROM stock_data WHERE cycle = %s ORDER BY ts_code", (cycle,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def load_latest_times(conn, frequency):
+    """stock_indicators 中每只股票已保存的最后一条指标时间 {code: datetime}"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT code, MAX(time) FROM stock_indicators WHERE frequency = %s GROUP BY code",
+            (frequency,))
+        return dict(cursor.fetchall())
+
+
+def load_cycle(conn, cycle, ts_codes):
+    """流式读取一组股票某一周期的完整K线（长表），每次从服务端取 BATCH_SIZE 行"""
+    placeholders = ', '.join(['%s'] * len(ts_codes))
+    frames = []
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(LOAD_COLUMNS)} FROM stock_data "
+            f"WHERE cycle = %s AND ts_code IN ({placeholders})",
+            (cycle, *ts_codes))
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            frames.append(pd.DataFrame(rows, columns=LOAD_COLUMNS))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LOAD_COLUMNS)
+
+
+def new_rows(result, latest_times):
+    """只保留每只股票最后一条已保存指标及之后的行
+
+    最后一条会重新写入：周线、月线等周期的 trade_date 为周期结束日，
+    未结束周期的K线每天在同一 trade_date 上更新。
+    """
+    codes = result['ts_code'].map(ts_code_to_code)
+    times = pd.to_datetime(result['trade_date'])
+    latest = pd.to_datetime(codes.map(latest_times))
+    keep = (latest.isna() | (times >= latest)).to_numpy()
+    result = result[keep].copy()
+    result['code'] = codes[keep].to_numpy()
+    return result
+
+
+def write_indicators(conn, result, frequency):
+    """分批写入 stock_indicators（result 含 new_rows 添加的 code 列），已存在的记录更新为最新计算结果
+
+    IGNORE：不在 stock_list 中的股票（外键约束）跳过而不中断整批写入。
+    """
+    columns = ['code', 'time', *INDICATOR_COLUMNS, 'frequency']
+    sql = f"""
+        INSERT IGNORE INTO stock_indicators ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        ON DUPLICATE KEY UPDATE {', '.join(f'{col}=VALUES({col})' for col in INDICATOR_COLUMNS)}
+    """
+    codes = result['code'].to_numpy()
+    times = pd.to_datetime(result['trade_date']).dt.to_pydatetime()
+    values = result[INDICATOR_COLUMNS].to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    written = 0
+    with conn.cursor() as cursor:
+        for start in range(0, len(result), BATCH_SIZE):
+            end = min(start + BATCH_SIZE, len(result))
+            rows = [(codes[i], times[i], *values[i], frequency) for i in range(start, end)]
+            cursor.executemany(sql, rows)
+            conn.commit()
+            written += len(rows)
+    return written
+
+
+def main():
+    start_time = time.time()
+    conn = create_database_connection()
+    try:
+        for cycle, frequency in CYCLE_FREQUENCIES.items():
+            cycle_start = time.time()
+            ts_codes = load_codes(conn, cycle)
+            if not ts_codes:
+                logger.info(f"{cycle} 周期没有数据，跳过")
+                continue
+            latest_times = load_latest_times(conn, frequency)
+            # EMA 等指标需要完整历史计算，但只写入每只股票最后一条已保存指标之后的结果
+            loaded = written = 0
+            for start in range(0, len(ts_codes), CODE_CHUNK_SIZE):
+                data = load_cycle(conn, cycle, ts_codes[start:start + CODE_CHUNK_SIZE])
+                loaded += len(data)
+                result = new_rows(calculate_panel_indicators(data), latest_times)
+                written += write_indicators(conn, result, frequency)
+                sys.stdout.write(f"\r{cycle}: {min(start + CODE_CHUNK_SIZE, len(ts_codes))}/{len(ts_codes)} 只股票")
+                sys.stdout.flush()
+            print()
+            logger.info(f"{cycle} 周期: {len(ts_codes)} 只股票，读取 {loaded} 根K线，写入 {written} 条指标，"
+                        f"耗时 {time.time() - cycle_start:.2f} 秒")
+    except Exception as e:
+        logger.error(f"指标计算失败: {e}")
+    finally:
+        conn.close()
+    logger.info(f"任务完成，总耗时: {time.time() - start_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -203,7 +203,9 @@ def main():
                 free_share FLOAT,
                 total_mv FLOAT,
                 circ_mv FLOAT,
-                PRIMARY KEY (ts_code, trade_date, cycle)
+                PRIMARY KEY (ts_code, trade_date, cycle),
+                -- Web 应用按股票、周期读取最近K线的覆盖索引（与 db_operations.STOCK_DATA_INDEXES 一致）
+                KEY idx_code_cycle_date (ts_code, cycle, trade_date, open, high, low, close, vol, amount)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
             """
             cursor.execute(create_table_sql)
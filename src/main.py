@@ -44,6 +44,9 @@ def main():
     print("--------------------更新数据库--------------------")
     subprocess.run(['python', os.path.join('Upload_mysql.py')], check=True)
 
+    print("--------------------计算全市场技术指标--------------------")
+    subprocess.run(['python', os.path.join('Compute_indicators.py')], check=True)
+
     end_time = time.time()
     total_time = end_time - start_time
     print(f"--------------------基础数据、日、周、月、季、年线数据拉取并更新结束，耗时：{total_time:.2f} 秒--------------------")
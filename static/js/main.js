@@ -28,16 +28,43 @@ function highlightCurrentNav() {
     });
 }
 
-// 股票选择下拉框初始化
+// 股票选择框初始化：输入代码、名称或拼音首字母时从 /api/search 获取候选
 function initStockSelect() {
     const stockSelect = document.getElementById('stock-select');
-    if (stockSelect) {
-        stockSelect.addEventListener('change', function() {
-            // 自动提交表单或跳转
-            const form = this.closest('form');
-            if (form) form.submit();
+    if (!stockSelect) return;
+    
+    const options = document.getElementById('stock-options');
+    let suggestions = [];
+    let timer = null;
+    
+    if (options) {
+        stockSelect.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = this.value.trim();
+            if (!query) return;
+            timer = setTimeout(() => {
+                fetch(`/api/search?q=${encodeURIComponent(query)}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        suggestions = data.results || [];
+                        options.innerHTML = '';
+                        suggestions.forEach(stock => {
+                            const option = document.createElement('option');
+                            option.value = stock.code;
+                            option.label = `${stock.code} - ${stock.name}`;
+                            options.appendChild(option);
+                        });
+                    });
+            }, 150);
         });
     }
+    
+    stockSelect.addEventListener('change', function() {
+        // 从候选中选定股票后自动提交表单
+        if (options && !suggestions.some(stock => stock.code === this.value)) return;
+        const form = this.closest('form');
+        if (form) form.submit();
+    });
 }
 
 // 通用的图表工具函数（如需）
@@ -45,3 +72,43 @@ function formatDate(dateString) {
     const date = new Date(dateString);
     return date.toLocaleDateString('zh-CN');
 }
+
+// 二进制列式数据（application/vnd.stock.columns）的 MIME 类型，格式见 serialization.frame_binary
+const COLUMNS_MIMETYPE = 'application/vnd.stock.columns';
+
+/**
+ * 以二进制列式格式请求数据，返回 {count, columns: {字段: Float64Array|Float32Array}, ...头部字段}；
+ * 服务端返回 JSON（出错）时抛出其中的错误信息
+ */
+function fetchColumns(url) {
+    return fetch(url, { headers: { 'Accept': COLUMNS_MIMETYPE } })
+        .then(response => {
+            const type = response.headers.get('Content-Type') || '';
+            if (!type.startsWith(COLUMNS_MIMETYPE)) {
+                return response.json().then(data => { throw new Error(data.message || '数据格式错误'); });
+            }
+            return response.arrayBuffer().then(decodeColumns);
+        });
+}
+
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'SCOL') {
+        throw new Error('数据格式错误');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const dataStart = 8 + headerLength;
+    const columns = {};
+    header.columns.forEach(column => {
+        const ArrayType = column.type === 'f8' ? Float64Array : Float32Array;
+        columns[column.name] = new ArrayType(buffer, dataStart + column.offset, header.count);
+    });
+    return { ...header, columns: columns };
+}
+
+// 二进制数据中的时间（秒）转为 'YYYY-MM-DD HH:MM:SS'
+function formatBarTime(seconds) {
+    return new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ');
+}
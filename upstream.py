@@ -0,0 +1,80 @@
+"""
+上游行情接口调用合并
+
+SingleFlight 包装一个取数函数：参数相同的并发调用只有第一个真正请求接口，
+其余调用等待并共享它的结果；结果再缓存 ttl 秒，短时间内的重复请求直接复用。
+返回 (结果, fresh)，fresh 仅对真正发起请求的调用为 True，
+调用方据此只由一个请求把新数据写入数据库。
+"""
+import threading
+import time
+
+from Ashare import get_price
+from config import PRICE_CACHE_TTL
+from metrics import record_cache, timed_upstream
+
+
+class _Call:
+    """一次进行中的请求"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按参数合并并发调用，并短时缓存结果"""
+
+    def __init__(self, fn, ttl, name=None):
+        self.fn = fn
+        self.ttl = ttl
+        # 指标中的缓存名称；缓存命中和共享进行中的请求都计为命中
+        self.name = name or fn.__name__
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> 进行中的 _Call
+        self._results = {}  # key -> (结果, 完成时间)
+
+    def __call__(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                record_cache(self.name, True)
+                return self._share(cached[0]), False
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        record_cache(self.name, not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._share(call.result), False
+
+        try:
+            call.result = self.fn(*args, **kwargs)
+        except Exception as e:
+            # 失败不缓存，等待中的调用收到同一个异常
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None:
+                    now = time.monotonic()
+                    self._results = {k: v for k, v in self._results.items() if now - v[1] < self.ttl}
+                    self._results[key] = (call.result, now)
+            call.done.set()
+        return call.result, True
+
+    @staticmethod
+    def _share(result):
+        # 共享的 DataFrame 复制一份，避免调用方之间相互修改
+        return result.copy() if hasattr(result, 'copy') else result
+
+
+# 合并后的行情接口：fetch_price(code, count=..., frequency=...) -> (DataFrame, fresh)
+fetch_price = SingleFlight(timed_upstream(get_price), PRICE_CACHE_TTL, name='price')